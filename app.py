@@ -12,7 +12,7 @@ Web应用模块 (app.py)
     5. 会话管理：使用Flask会话维护对话历史
 
 主要组件：
-    - create_connection(): 创建数据库连接
+    - create_connection(): 从连接池借出数据库连接
     - index(): 提供主页面路由
     - test_connection(): 测试数据库连接API
     - query(): 处理查询请求API
@@ -22,6 +22,7 @@ API端点：
     - GET  /: 返回主页面
     - POST /api/test-connection: 测试数据库连接
     - POST /api/stream-query: 流式执行AI辅助查询
+    - POST /api/update-rows: 批量更新多行表数据
 
 工作流程：
     1. Web界面交互
@@ -55,53 +56,159 @@ API端点：
 依赖项：
     - flask: Web框架
     - mysql.connector: MySQL数据库连接
+    - db.connection: 数据库连接池
+    - utils.visualization: 可视化类型推荐
     - llm_interaction: AI模型交互
     - flask_cors: CORS支持
+    - flask_compress: 响应压缩
+    - orjson: 流式响应的JSON编码
 """
 
-from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context
+from flask import Flask, request, jsonify, session, Response, stream_with_context, send_from_directory
 import mysql.connector
+from mysql.connector import errorcode
 import json
+import os
 import uuid
+import zlib
 import time
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import queue
 import threading
-from functools import wraps
-from llm_interaction import generate_sql, generate_answer, stream_generate_answer
-from db.utils import get_enhanced_database_structure, analyze_table_relationships
+from functools import wraps, partial, lru_cache
+from llm_interaction import generate_sql, generate_answer, stream_generate_answer, invalidate_structure_cache
+from db.connection import get_pooled_connection, get_pool_key, reset_pooled_session
+from utils.visualization import recommend_visualization
+from db.utils import get_enhanced_database_structure, analyze_table_relationships, fetch_dict_rows, iter_dict_row_chunks, quote_identifier, invalidate_schema_cache, get_statement_keyword, READ_ONLY_STATEMENTS
 import re
 import logging
 import sys
-from io import StringIO
+from collections import deque
 from flask_cors import CORS  # 导入CORS支持
+from flask_compress import Compress
 import datetime
 import decimal
+import orjson
 
 app = Flask(__name__)
 # 启用CORS，允许所有来源的跨域请求
 CORS(app)
 app.secret_key = 'mysql_ai_tool_secret_key'  # 用于会话加密
 
-# 全局变量存储活跃的数据库连接
-active_connections = {}
-# 全局变量存储对话历史
+# 启用响应压缩（查询结果JSON重复的列名较多，压缩率很高）
+# 流式响应由 stream_query 自行逐块压缩，这里不处理
+COMPRESS_LEVEL = 4
+app.config.update(
+    COMPRESS_MIN_SIZE=1024,
+    COMPRESS_ALGORITHM=['br', 'gzip'],
+    COMPRESS_LEVEL=COMPRESS_LEVEL,
+    COMPRESS_STREAMS=False
+)
+Compress(app)
+
+# 全局变量存储对话历史，每个会话一个定长队列
 conversation_histories = {}
-# 连接锁，防止并发问题
-connection_lock = threading.Lock()
-
-# 创建内存日志处理器用于捕获日志
+# 每个会话最近一次访问对话历史的时间
+session_last_access = {}
+# 每个会话保留的对话轮数
+CONVERSATION_HISTORY_LIMIT = 10
+# 会话不活跃超过该秒数后清理
+SESSION_IDLE_TIMEOUT = 2 * 60 * 60
+# 后台清理线程的检查间隔（秒）
+SESSION_REAP_INTERVAL = 60
+# 会话过期时间堆，元素为 (预计过期时间, 会话ID)，每个会话只有一个条目
+session_expiry_heap = []
+# 保护 session_last_access 与 session_expiry_heap
+session_lock = threading.Lock()
+# 后台清理线程，首次记录会话时启动
+session_reaper = None
+
+# 流式响应缓冲区达到该字节数时才写出
+STREAM_FLUSH_BYTES = 16384
+# 回答片段合并的大小上限（字符数）和时间上限（秒）
+ANSWER_FLUSH_SIZE = 4096
+ANSWER_FLUSH_INTERVAL = 0.02
+# 流式查询每批读取的行数
+STREAM_FETCH_SIZE = 500
+# 流式查询保留给AI解释的最大行数
+STREAM_ANSWER_ROWS = 200
+# 流式查询后台读取线程最多预读的批次数
+STREAM_QUEUE_CHUNKS = 4
+# 流式查询后台读取结果的线程池
+stream_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='stream-fetch')
+
+# /api/query 每批读取的行数；一批读不完的结果改为分块流式输出，不再整体载入内存
+QUERY_FETCH_SIZE = 1000
+
+# /api/query 只读查询结果缓存的有效期（秒）、最大条目数，以及等待相同查询执行完成的最长时间（秒）
+QUERY_CACHE_TTL = 30
+QUERY_CACHE_MAX_ENTRIES = 256
+QUERY_CACHE_WAIT_TIMEOUT = 30
+# 结果随时间、会话或服务器状态变化的只读查询，不进入结果缓存
+NONDETERMINISTIC_SQL_RE = re.compile(
+    r'\b(?:now|sysdate|curdate|curtime|unix_timestamp|utc_date|utc_time|utc_timestamp|rand|uuid|uuid_short'
+    r'|connection_id|last_insert_id|found_rows|row_count|get_lock|is_free_lock|is_used_lock|sleep|benchmark)\s*\('
+    r'|\b(?:current_date|current_time|current_timestamp|localtime|localtimestamp)\b'
+    r'|^\s*show\s+(?:(?:full|global|session)\s+)*(?:status|processlist|variables|warnings|errors|profiles?'
+    r'|engines?|open\s+tables|master|slave|replica|binary|binlog)\b'
+    r'|\bperformance_schema\.|\binformation_schema\.processlist\b',
+    re.IGNORECASE
+)
+# 查询结果缓存，键为 (连接池键, 规范化SQL)，值为 (过期时间, 结果)，按最近使用排序
+query_cache = {}
+# 正在执行中的查询，键同上，值为执行完成时触发的 Event，相同查询的并发请求等待它而不是重复执行
+query_cache_pending = {}
+query_cache_lock = threading.Lock()
+# SQL规范化：保留引号内的内容，其余连续空白压缩为一个空格
+SQL_WHITESPACE_RE = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`)|\s+""")
+
+# orjson 序列化选项：允许非字符串的字典键（如数字列名）
+JSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+# 多语句检测：分号后仍有非空白内容
+MULTI_STATEMENT_RE = re.compile(r';\s*\S')
+# USE 语句会改变连接的默认数据库，连接池按数据库区分，执行任意SQL的接口不允许切换
+USE_STATEMENT_RE = re.compile(r'(?:^|;)\s*use\b', re.IGNORECASE)
+
+# /api/query 按修改语句处理（返回影响行数并提交）的首个关键字
+WRITE_STATEMENTS = frozenset(('insert', 'update', 'delete', 'create', 'alter', 'drop', 'truncate', 'replace'))
+# 表示连接已断开的MySQL客户端错误码
+CONNECTION_LOST_ERRNOS = frozenset((errorcode.CR_SERVER_GONE_ERROR, errorcode.CR_SERVER_LOST))
+
+# 是否记录每个API请求的详细信息（请求头、请求体）
+VERBOSE_REQUEST_LOGGING = os.environ.get('MYSQL_AI_VERBOSE') == '1'
+# 详细请求日志中请求体的最大记录长度
+REQUEST_LOG_BODY_LIMIT = 2048
+
+# 内存日志最多保留的条数
+MEMORY_LOG_MAX_RECORDS = 5000
+
+# 创建内存日志处理器用于捕获日志（定长缓冲，超出后丢弃最早的日志）
 class MemoryHandler(logging.Handler):
-    def __init__(self):
+    def __init__(self, capacity=MEMORY_LOG_MAX_RECORDS):
         super().__init__()
-        self.logs = StringIO()
+        self.capacity = capacity
+        self.logs = deque(maxlen=capacity)
     
     def emit(self, record):
-        self.logs.write(self.format(record) + '\n')
+        self.logs.append(self.format(record))
     
     def get_logs(self):
-        return self.logs.getvalue()
+        # emit() 在 Handler.lock 保护下执行，读取时同样加锁，避免遍历过程中被修改
+        with self.lock:
+            return '\n'.join(self.logs) + '\n' if self.logs else ''
     
     def clear(self):
-        self.logs = StringIO()
+        with self.lock:
+            self.logs.clear()
+    
+    def drain(self):
+        """取出当前全部日志并清空：加锁时只交换缓冲区，拼接在锁外进行"""
+        with self.lock:
+            logs, self.logs = self.logs, deque(maxlen=self.capacity)
+        return '\n'.join(logs) + '\n' if logs else ''
 
 # 创建内存日志处理器
 memory_handler = MemoryHandler()
@@ -145,6 +252,27 @@ def get_session_id():
         session['session_id'] = str(uuid.uuid4())
     return session['session_id']
 
+def is_read_only_sql(sql_query):
+    """根据首个关键字判断是否为只读语句（这类语句在连接断开后可以安全重试）"""
+    return get_statement_keyword(sql_query) in READ_ONLY_STATEMENTS
+
+def get_request_json():
+    """使用orjson解析请求体，请求体为空时返回None"""
+    body = request.get_data(cache=False)
+    if not body:
+        return None
+    return orjson.loads(body)
+
+class MaskedConfig:
+    """日志中的连接配置：隐藏密码，并且只在日志真正输出时才序列化"""
+    __slots__ = ('config',)
+
+    def __init__(self, config):
+        self.config = config
+
+    def __str__(self):
+        return json.dumps({k: ('***' if k == 'password' else v) for k, v in self.config.items()})
+
 def with_error_handling(f):
     """API错误处理装饰器"""
     @wraps(f)
@@ -157,69 +285,310 @@ def with_error_handling(f):
     return decorated_function
 
 def create_connection(config):
-    """创建数据库连接"""
+    """从连接池借出数据库连接"""
     try:
-        connection = mysql.connector.connect(
-            user=config['username'],
-            password=config['password'],
-            host=config['host'],
-            port=int(config['port']),
-            database=config.get('database'),
-            connect_timeout=10  # 添加连接超时
-        )
-        return connection
+        return get_pooled_connection(config)
     except Exception as e:
         raise Exception(f"数据库连接失败: {str(e)}")
 
 def get_or_create_connection(config):
-    """获取或创建数据库连接，管理连接池"""
-    session_id = get_session_id()
-    connection_key = json.dumps({k: v for k, v in config.items() if k != 'password'})
-    
-    with connection_lock:
-        # 检查是否已有此连接
-        if session_id in active_connections and connection_key in active_connections[session_id]:
-            connection = active_connections[session_id][connection_key]
-            # 验证连接是否还活着
-            if connection.is_connected():
-                return connection
-            else:
-                # 如果断开，删除旧连接
-                del active_connections[session_id][connection_key]
-        
-        # 创建新连接
-        connection = create_connection(config)
-        
-        # 存储连接
-        if session_id not in active_connections:
-            active_connections[session_id] = {}
-        active_connections[session_id][connection_key] = connection
-        
-        return connection
+    """
+    获取数据库连接，连接来自按配置缓存的连接池
+    调用方用完后必须 close()，连接会归还连接池而不是断开
+    """
+    return create_connection(config)
+
+def json_default(value):
+    """orjson无法原生序列化的数据库类型的转换（datetime/date/time/UUID 由orjson原生处理）"""
+    if isinstance(value, decimal.Decimal):
+        # 转为字符串以保留精度，与Flask默认的JSON序列化一致
+        return str(value)
+    if isinstance(value, datetime.timedelta):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', errors='replace')
+    if isinstance(value, set):
+        return list(value)
+    raise TypeError(f"无法序列化类型: {type(value).__name__}")
+
+def encode_event(event):
+    """将流式事件编码为一行NDJSON"""
+    return orjson.dumps(event, default=json_default, option=JSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+
+def query_json_default(value, _decimal=decimal.Decimal, _float=float):
+    """
+    /api/query 的序列化转换：DECIMAL 转为浮点数（保持该接口原有的返回格式），其余同 json_default
+
+    orjson 对结果中的每个 DECIMAL 值各调用一次，用到的类型绑定为默认参数，按局部变量访问
+    """
+    if type(value) is _decimal:
+        return _float(value)
+    return json_default(value)
+
+def json_response(payload, status=200, default=json_default):
+    """使用orjson序列化的JSON响应，用于携带查询结果的接口"""
+    return Response(
+        orjson.dumps(payload, default=default, option=JSON_OPTIONS),
+        status=status,
+        mimetype='application/json'
+    )
+
+# 流式查询中固定不变的事件，启动时编码一次
+STATUS_EVENTS = {
+    status: encode_event({'type': 'status', 'data': status})
+    for status in ('准备中', '解析SQL', '执行查询', '处理结果', '生成解释', '完成')
+}
+DONE_EVENT = encode_event({'type': 'done'})
+
+def buffered_ndjson(events):
+    """
+    将事件序列编码为NDJSON并批量写出，减少逐事件的网络写入
+
+    - 普通事件累积到 STREAM_FLUSH_BYTES 后写出
+    - status 事件标志一个耗时阶段的开始，error/done 事件标志结束，均立即写出
+    - 连续的 answer_chunk 合并到 ANSWER_FLUSH_SIZE 或 ANSWER_FLUSH_INTERVAL 后写出
+    - bytes 类型的事件是预先编码好的 status/done 事件（见 STATUS_EVENTS），直接写出
+    """
+    buffer = bytearray()
+    answer_parts = []
+    answer_size = 0
+    answer_started = 0.0
+
+    for event in events:
+        if isinstance(event, bytes):
+            if answer_parts:
+                buffer += encode_event({'type': 'answer_chunk', 'data': ''.join(answer_parts)})
+                answer_parts.clear()
+                answer_size = 0
+            buffer += event
+            yield bytes(buffer)
+            buffer.clear()
+            continue
+
+        if event['type'] == 'answer_chunk':
+            if not answer_parts:
+                answer_started = time.monotonic()
+            answer_parts.append(event['data'])
+            answer_size += len(event['data'])
+            if answer_size < ANSWER_FLUSH_SIZE and time.monotonic() - answer_started < ANSWER_FLUSH_INTERVAL:
+                continue
+            buffer += encode_event({'type': 'answer_chunk', 'data': ''.join(answer_parts)})
+            answer_parts.clear()
+            answer_size = 0
+            yield bytes(buffer)
+            buffer.clear()
+            continue
+
+        if answer_parts:
+            buffer += encode_event({'type': 'answer_chunk', 'data': ''.join(answer_parts)})
+            answer_parts.clear()
+            answer_size = 0
+
+        buffer += encode_event(event)
+        if len(buffer) >= STREAM_FLUSH_BYTES or event['type'] in ('status', 'error', 'done'):
+            yield bytes(buffer)
+            buffer.clear()
+
+    if answer_parts:
+        buffer += encode_event({'type': 'answer_chunk', 'data': ''.join(answer_parts)})
+    if buffer:
+        yield bytes(buffer)
+
+class StreamedRows:
+    """
+    在后台线程中执行查询并分批读取结果，供流式接口在下发其他事件的同时穿插下发结果
+
+    属性:
+        results: 前 STREAM_ANSWER_ROWS 行，用于生成解释
+        row_count: 已下发的结果行数
+    """
+
+    def __init__(self, cursor, sql_query):
+        self.results = []
+        self.row_count = 0
+        self.done = False
+        self._queue = queue.Queue(maxsize=STREAM_QUEUE_CHUNKS)
+        self._cancelled = threading.Event()
+        self._future = stream_executor.submit(self._fetch, cursor, sql_query)
+
+    def _put(self, item):
+        """放入队列；队列满时等待，被取消时放弃"""
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _fetch(self, cursor, sql_query):
+        """后台线程：执行查询并分批放入队列，结束（包括出错）时放入 None"""
+        try:
+            cursor.execute(sql_query)
+            for rows in iter_dict_row_chunks(cursor, STREAM_FETCH_SIZE):
+                if not self._put(rows):
+                    break
+        finally:
+            self._put(None)
+
+    def events(self, block=True, min_rows=None):
+        """
+        产出已读取结果的 results_chunk 事件
+
+        block 为 False 时只下发已就绪的批次；指定 min_rows 时，保留的行数达到该值即停止。
+        查询出错时在读取到结束标记后抛出原始异常。
+        """
+        while not self.done:
+            if min_rows is not None and len(self.results) >= min_rows:
+                return
+            try:
+                rows = self._queue.get(block=block)
+            except queue.Empty:
+                return
+            if rows is None:
+                self.done = True
+                self._future.result()
+                return
+            self.row_count += len(rows)
+            if len(self.results) < STREAM_ANSWER_ROWS:
+                self.results.extend(rows[:STREAM_ANSWER_ROWS - len(self.results)])
+            yield {'type': 'results_chunk', 'data': rows}
+
+    def close(self):
+        """停止后台读取并等待线程退出"""
+        self._cancelled.set()
+        try:
+            self._future.result()
+        except Exception:
+            pass
+
+def touch_session(session_id):
+    """记录会话的访问时间，首次出现的会话加入过期时间堆"""
+    now = time.time()
+    with session_lock:
+        if session_id not in session_last_access:
+            heapq.heappush(session_expiry_heap, (now + SESSION_IDLE_TIMEOUT, session_id))
+        session_last_access[session_id] = now
+    start_session_reaper()
+
+def reap_idle_sessions():
+    """
+    后台线程：定期弹出堆顶已到期的会话
+
+    会话在入堆后可能又被访问过，此时按最新访问时间重新入堆，否则清理其对话历史
+    """
+    while True:
+        time.sleep(SESSION_REAP_INTERVAL)
+        now = time.time()
+        with session_lock:
+            while session_expiry_heap and session_expiry_heap[0][0] <= now:
+                _, session_id = heapq.heappop(session_expiry_heap)
+                last_access = session_last_access.get(session_id)
+                if last_access is None:
+                    continue
+                expire_at = last_access + SESSION_IDLE_TIMEOUT
+                if expire_at > now:
+                    heapq.heappush(session_expiry_heap, (expire_at, session_id))
+                else:
+                    del session_last_access[session_id]
+                    conversation_histories.pop(session_id, None)
+
+def start_session_reaper():
+    """启动后台会话清理线程（只启动一次）"""
+    global session_reaper
+    if session_reaper is not None:
+        return
+    with session_lock:
+        if session_reaper is None:
+            session_reaper = threading.Thread(target=reap_idle_sessions, name='session-reaper', daemon=True)
+            session_reaper.start()
+
+def gzip_stream(chunks):
+    """逐块gzip压缩流式响应，每块之后同步刷新，保证客户端能立即解压出已发送的事件"""
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def streaming_response(body, content_type):
+    """流式响应：客户端支持gzip时逐块压缩（Flask-Compress 不处理流式响应）"""
+    headers = {}
+    if 'gzip' in request.accept_encodings:
+        body = gzip_stream(body)
+        headers = {'Content-Encoding': 'gzip', 'Vary': 'Accept-Encoding'}
+    return Response(stream_with_context(body), content_type=content_type, headers=headers)
+
+def normalize_sql(sql):
+    """规范化SQL文本作为缓存键：压缩引号外的空白，去掉末尾分号"""
+    return SQL_WHITESPACE_RE.sub(lambda m: m.group(1) or ' ', sql).strip().rstrip(';').rstrip()
+
+def claim_query_result(key):
+    """
+    查找查询结果缓存
+
+    返回 (缓存结果, 执行凭证)：命中时返回结果；未命中时登记本请求为该查询的执行者并返回凭证，
+    执行者完成后必须调用 release_query_claim()。相同查询正在执行时先等待其完成再查缓存
+    """
+    while True:
+        with query_cache_lock:
+            entry = query_cache.pop(key, None)
+            if entry is not None and entry[0] > time.monotonic():
+                # 重新插入，保持字典按最近使用排序
+                query_cache[key] = entry
+                return entry[1], None
+            pending = query_cache_pending.get(key)
+            if pending is None:
+                claim = query_cache_pending[key] = threading.Event()
+                return None, claim
+        if not pending.wait(QUERY_CACHE_WAIT_TIMEOUT):
+            # 等待超时则不再排队，直接执行
+            return None, None
+
+def release_query_claim(key, claim, result=None):
+    """执行者完成查询：成功时写入缓存，并唤醒等待相同查询的请求"""
+    with query_cache_lock:
+        if result is not None:
+            if len(query_cache) >= QUERY_CACHE_MAX_ENTRIES:
+                del query_cache[next(iter(query_cache))]
+            query_cache[key] = (time.monotonic() + QUERY_CACHE_TTL, result)
+        if query_cache_pending.get(key) is claim:
+            del query_cache_pending[key]
+    claim.set()
+
+def invalidate_cached_results(config):
+    """数据被修改后，丢弃该连接配置下的结构缓存和查询结果缓存（样例数据、行数和查询结果已过时）"""
+    pool_key = get_pool_key(config)
+    invalidate_schema_cache(config['host'], int(config['port']), config['username'])
+    invalidate_structure_cache(config['host'], int(config['port']), config['username'])
+    with query_cache_lock:
+        for key in [k for k in query_cache if k[0] == pool_key]:
+            del query_cache[key]
 
 def get_conversation_history(session_id):
-    """获取当前会话的对话历史"""
-    if session_id not in conversation_histories:
-        conversation_histories[session_id] = []
-    return conversation_histories[session_id]
+    """获取当前会话的对话历史（返回快照列表，不受后续追加影响）"""
+    touch_session(session_id)
+    history = conversation_histories.get(session_id)
+    return list(history) if history else []
 
 def add_to_conversation_history(session_id, user_question, sql_query):
-    """添加对话到历史记录"""
-    if session_id not in conversation_histories:
-        conversation_histories[session_id] = []
-    
-    # 限制历史长度为10条
-    if len(conversation_histories[session_id]) >= 10:
-        conversation_histories[session_id] = conversation_histories[session_id][-9:]
+    """添加对话到历史记录，超出 CONVERSATION_HISTORY_LIMIT 时自动丢弃最早的记录"""
+    touch_session(session_id)
+    history = conversation_histories.get(session_id)
+    if history is None:
+        history = conversation_histories.setdefault(session_id, deque(maxlen=CONVERSATION_HISTORY_LIMIT))
     
-    conversation_histories[session_id].append({
+    history.append({
         "user": user_question,
         "response": sql_query
     })
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    # index.html 不含模板变量，直接作为静态文件返回，由 Werkzeug 生成 ETag 并处理 304；
+    # max_age=0 让浏览器每次重新验证，升级后能立即拿到新页面
+    return send_from_directory(app.template_folder, 'index.html', max_age=0, conditional=True)
 
 @app.route('/api/test-connection', methods=['POST'])
 @with_error_handling
@@ -238,20 +607,9 @@ def test_connection():
             return jsonify({'success': False, 'error': '缺少数据库配置'}), 400
             
         try:
-            # 直接创建新连接
-            app.logger.info("Test Connection - 正在创建新的数据库连接...")
-            connection = mysql.connector.connect(
-                user=config['username'],
-                password=config['password'],
-                host=config['host'],
-                port=int(config['port']),
-                database=config.get('database'),
-                connect_timeout=30
-            )
-            
-            if not connection.is_connected():
-                raise Exception("无法建立数据库连接")
-                
+            app.logger.info("Test Connection - 正在从连接池获取数据库连接...")
+            # 连接池借出连接时已校验连接可用，无需再次 ping
+            connection = get_or_create_connection(config)
             app.logger.info("Test Connection - 数据库连接成功")
         except Exception as e:
             app.logger.error(f"Test Connection - 连接失败: {str(e)}")
@@ -261,11 +619,14 @@ def test_connection():
             })
         
         try:
-            # 获取所有数据库
+            # 获取所有用户数据库（系统库在服务端过滤）
             cursor = connection.cursor()
-            cursor.execute("SHOW DATABASES")
-            databases = [db[0] for db in cursor.fetchall() 
-                        if db[0] not in ['information_schema', 'performance_schema', 'mysql', 'sys']]
+            cursor.execute(
+                "SELECT schema_name FROM information_schema.schemata "
+                "WHERE schema_name NOT IN ('information_schema', 'performance_schema', 'mysql', 'sys') "
+                "ORDER BY schema_name"
+            )
+            databases = [row[0] for row in cursor]
             
             app.logger.info(f"Test Connection - 成功获取数据库列表，共 {len(databases)} 个数据库")
             
@@ -289,10 +650,10 @@ def test_connection():
             except Exception as e:
                 app.logger.error(f"Test Connection - 关闭游标失败: {str(e)}")
                 
-        if connection and connection.is_connected():
+        if connection:
             try:
                 connection.close()
-                app.logger.info("Test Connection - 数据库连接已关闭")
+                app.logger.info("Test Connection - 数据库连接已归还连接池")
             except Exception as e:
                 app.logger.error(f"Test Connection - 关闭连接失败: {str(e)}")
 
@@ -300,6 +661,7 @@ def test_connection():
 @with_error_handling
 def natural_language_query():
     """处理自然语言查询请求，生成并执行SQL"""
+    connection = None
     try:
         app.logger.info("=====================")
         app.logger.info("收到 /api/nl-query 请求")
@@ -328,8 +690,10 @@ def natural_language_query():
         # 调用优化后的 SQL 生成函数
         sql_query = None
         try:
-            sql_query = generate_sql(user_question, conversation_history, connection)
-            app.logger.info(f"NL Query - SQL生成成功: {sql_query}")
+            sql_query = generate_sql(user_question, conversation_history, connection, config.get('database'))
+            app.logger.info("NL Query - SQL生成成功: %s", sql_query)
+            if USE_STATEMENT_RE.search(sql_query):
+                raise ValueError("生成的SQL包含USE语句，请在连接配置中切换数据库")
         except (ValueError, RuntimeError, ConnectionError) as e:
             # Catch specific errors from generate_sql
             app.logger.error(f"NL Query - SQL生成失败: {str(e)}")
@@ -342,13 +706,14 @@ def natural_language_query():
         # 执行查询
         results = []
         try:
-            app.logger.info(f"NL Query - 开始执行生成的SQL: {sql_query}")
-            cursor = connection.cursor(dictionary=True)
+            app.logger.info("NL Query - 开始执行生成的SQL: %s", sql_query)
+            cursor = connection.cursor()
             cursor.execute(sql_query)
             if cursor.description:
-                results = cursor.fetchall()
+                results = fetch_dict_rows(cursor)
             else:
                 connection.commit() # Commit if it was a modification
+                invalidate_cached_results(config)
                 results = [{"status": "success", "rows_affected": cursor.rowcount}]
             cursor.close()
             app.logger.info(f"NL Query - 查询执行成功，返回 {len(results)} 条记录 (或状态)")
@@ -382,11 +747,16 @@ def natural_language_query():
             'answer': answer
         }
         app.logger.info("NL Query - 请求处理完成")
-        return jsonify(response_data)
+        return json_response(response_data)
 
     except Exception as e:
         app.logger.error(f"处理 NL Query 时发生顶层错误: {str(e)}", exc_info=True)
         return jsonify({'error': f'处理自然语言查询时发生内部错误: {str(e)}'}), 500
+    finally:
+        # 执行的是生成的SQL，清除会话状态后再归还连接池
+        if connection:
+            reset_pooled_session(connection)
+            connection.close()
 
 @app.route('/api/direct-sql', methods=['POST'])
 @with_error_handling
@@ -397,39 +767,30 @@ def direct_sql_execution():
     try:
         app.logger.info("=====================")
         app.logger.info("收到 /api/direct-sql 请求")
-        data = request.json
+        data = get_request_json() or {}
         sql_query = data.get('sql')
         config = data.get('config', {})
 
-        app.logger.info(f"Direct SQL: {sql_query}")
+        app.logger.info("Direct SQL: %s", sql_query)
 
         if not config or not sql_query:
             app.logger.warning("Direct SQL - 缺少必要参数")
             return jsonify({'error': '缺少配置或SQL参数'}), 400
 
-        # 基本安全性检查
-        sql_lower = sql_query.lower().strip()
-        if ';' in sql_lower[:-1]: 
-             app.logger.warning(f"Direct SQL - 检测到多语句，已拒绝: {sql_query}")
+        # 基本安全性检查（允许末尾分号，拒绝分号后还有内容的多语句）
+        if MULTI_STATEMENT_RE.search(sql_query.rstrip().rstrip(';')):
+             app.logger.warning("Direct SQL - 检测到多语句，已拒绝: %s", sql_query)
              return jsonify({'error': '不支持执行多个SQL语句'}), 400
+        if USE_STATEMENT_RE.search(sql_query):
+            app.logger.warning("Direct SQL - 检测到USE语句，已拒绝: %s", sql_query)
+            return jsonify({'error': '不支持USE语句，请在连接配置中切换数据库'}), 400
 
-        # 创建全新的数据库连接 - 不使用连接池
+        # 从连接池获取数据库连接
         try:
-            # 直接创建新连接，不使用get_or_create_connection
-            app.logger.info("Direct SQL - 正在创建全新的数据库连接...")
-            connection = mysql.connector.connect(
-                user=config['username'],
-                password=config['password'],
-                host=config['host'],
-                port=int(config['port']),
-                database=config.get('database'),
-                connect_timeout=30,  # 增加连接超时
-                autocommit=False     # 明确设置手动提交事务
-            )
-            if not connection.is_connected():
-                raise Exception("无法建立数据库连接")
-                
-            app.logger.info("Direct SQL - 已创建新的数据库连接")
+            app.logger.info("Direct SQL - 正在从连接池获取数据库连接...")
+            # 连接池借出连接时已校验连接可用，无需再次 ping
+            connection = get_or_create_connection(config)
+            app.logger.info("Direct SQL - 已获取数据库连接")
         except Exception as e:
             app.logger.error(f"Direct SQL - 创建数据库连接失败: {str(e)}")
             return jsonify({'error': f'数据库连接失败: {str(e)}'}), 500
@@ -438,29 +799,31 @@ def direct_sql_execution():
         results = []
         start_time = time.time()
         try:
-            app.logger.info(f"Direct SQL - 开始执行: {sql_query}")
-            cursor = connection.cursor(dictionary=True)
+            app.logger.info("Direct SQL - 开始执行: %s", sql_query)
+            cursor = connection.cursor()
             
-            # 测试连接是否真正可用
-            app.logger.info("Direct SQL - 执行测试查询确认连接可用...")
+            # 执行实际查询；连接在借出后断开时，只读语句换一个连接重试一次
             try:
-                test_cursor = connection.cursor()
-                test_cursor.execute("SELECT 1")
-                test_cursor.fetchall()
-                test_cursor.close()
-                app.logger.info("Direct SQL - 测试查询成功，连接有效")
-            except Exception as test_e:
-                app.logger.error(f"Direct SQL - 测试查询失败，连接无效: {str(test_e)}")
-                raise Exception(f"数据库连接测试失败: {str(test_e)}")
-            
-            # 执行实际查询
-            cursor.execute(sql_query)
+                cursor.execute(sql_query)
+            except mysql.connector.errors.OperationalError as e:
+                if e.errno not in CONNECTION_LOST_ERRNOS or not is_read_only_sql(sql_query):
+                    raise
+                app.logger.warning(f"Direct SQL - 数据库连接已断开，重新获取连接后重试: {str(e)}")
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+                connection.close()
+                connection = get_or_create_connection(config)
+                cursor = connection.cursor()
+                cursor.execute(sql_query)
             
             if cursor.description: # 处理 SELECT, SHOW 等返回结果的查询
-                results = cursor.fetchall()
+                results = fetch_dict_rows(cursor)
                 app.logger.info(f"Direct SQL - 查询成功 (有结果集)，返回 {len(results)} 条记录")
             else: # 处理 INSERT, UPDATE, DELETE 等不返回结果的查询
                 connection.commit() # 提交事务
+                invalidate_cached_results(config)
                 results = [{"status": "success", "rows_affected": cursor.rowcount}]
                 app.logger.info(f"Direct SQL - 查询成功 (无结果集)，影响 {cursor.rowcount} 行")
 
@@ -471,7 +834,7 @@ def direct_sql_execution():
             execution_time = time.time() - start_time
             app.logger.error(f"Direct SQL - MySQL执行错误 (耗时 {execution_time:.4f} 秒): {str(e)}")
             try:
-                if connection and connection.is_connected():
+                if connection:
                     connection.rollback()
                     app.logger.info("Direct SQL - 事务已回滚")
             except Exception as rb_err:
@@ -483,7 +846,7 @@ def direct_sql_execution():
             execution_time = time.time() - start_time
             app.logger.error(f"Direct SQL - 执行过程中发生异常 (耗时 {execution_time:.4f} 秒): {str(e)}")
             try:
-                if connection and connection.is_connected():
+                if connection:
                     connection.rollback()
             except: pass
             return jsonify({'error': f'执行SQL时发生错误: {str(e)}'}), 500
@@ -497,12 +860,12 @@ def direct_sql_execution():
                 except Exception as cur_err:
                     app.logger.error(f"Direct SQL - 关闭游标失败: {str(cur_err)}")
             
-            # 现在总是关闭连接，不再保留在连接池中
+            # 清除会话状态后归还连接到连接池
             if connection:
                 try:
-                    if connection.is_connected():
-                        connection.close()
-                        app.logger.info("Direct SQL - 数据库连接已关闭")
+                    reset_pooled_session(connection)
+                    connection.close()
+                    app.logger.info("Direct SQL - 数据库连接已归还连接池")
                 except Exception as conn_err:
                     app.logger.error(f"Direct SQL - 关闭连接失败: {str(conn_err)}")
 
@@ -513,7 +876,7 @@ def direct_sql_execution():
             'answer': 'SQL已直接执行。'
         }
         app.logger.info("Direct SQL - 请求处理完成")
-        return jsonify(response_data)
+        return json_response(response_data)
 
     except Exception as e: # 捕获函数顶层的意外错误
         app.logger.error(f"处理 Direct SQL 时发生顶层错误: {str(e)}", exc_info=True)
@@ -542,102 +905,91 @@ def stream_query():
     conversation_history = get_conversation_history(session_id)
     
     try:
-        # 发送准备阶段状态
+        # 逐个产出事件，由 buffered_ndjson 负责编码和批量写出
         def generate():
             # 首先发送准备状态
             app.logger.info("开始流式生成")
-            yield json.dumps({
-                'type': 'status',
-                'data': '准备中'
-            }) + '\n'
+            yield STATUS_EVENTS['准备中']
             
+            connection = None
+            cursor = None
+            streamed_rows = None
             try:
-                # 创建数据库连接
-                app.logger.info(f"开始创建数据库连接: {config}")
+                # 获取数据库连接
+                app.logger.info(f"开始获取数据库连接: {config}")
                 connection = get_or_create_connection(config)
                 
                 # 发送SQL解析阶段状态
-                yield json.dumps({
-                    'type': 'status',
-                    'data': '解析SQL'
-                }) + '\n'
+                yield STATUS_EVENTS['解析SQL']
                 
                 # 生成SQL
                 app.logger.info(f"开始生成SQL: {user_question}")
-                sql_query = generate_sql(user_question, conversation_history, connection=connection)
-                app.logger.info(f"生成的SQL: {sql_query}")
+                sql_query = generate_sql(user_question, conversation_history, connection=connection, database=config.get('database'))
+                app.logger.info("生成的SQL: %s", sql_query)
                 
                 # 返回SQL结果
-                yield json.dumps({
-                    'type': 'sql',
-                    'data': sql_query
-                }) + '\n'
+                yield {'type': 'sql', 'data': sql_query}
+                if USE_STATEMENT_RE.search(sql_query):
+                    yield {'type': 'error', 'data': "生成的SQL包含USE语句，请在连接配置中切换数据库"}
+                    return
                 
                 # 发送查询执行阶段状态
-                yield json.dumps({
-                    'type': 'status',
-                    'data': '执行查询'
-                }) + '\n'
+                yield STATUS_EVENTS['执行查询']
                 
-                # 执行查询
+                # 在后台线程中执行查询并分批读取结果（非缓冲游标），
+                # 使结果读取与结果下发、解释生成重叠进行
                 app.logger.info(f"开始执行SQL查询")
-                cursor = connection.cursor(dictionary=True)
-                cursor.execute(sql_query)
-                results = cursor.fetchall()
-                app.logger.info(f"查询执行完成，返回 {len(results)} 条记录")
+                cursor = connection.cursor(buffered=False)
+                streamed_rows = StreamedRows(cursor, sql_query)
                 
                 # 发送结果处理阶段状态
-                yield json.dumps({
-                    'type': 'status',
-                    'data': '处理结果'
-                }) + '\n'
+                yield STATUS_EVENTS['处理结果']
                 
-                # 返回查询结果
-                yield json.dumps({
-                    'type': 'results',
-                    'data': results
-                }) + '\n'
+                # 先下发生成解释所需的前若干行
+                yield from streamed_rows.events(min_rows=STREAM_ANSWER_ROWS)
                 
                 # 添加到对话历史
                 add_to_conversation_history(session_id, user_question, sql_query)
                 
                 # 发送解释生成阶段状态
-                yield json.dumps({
-                    'type': 'status',
-                    'data': '生成解释'
-                }) + '\n'
+                yield STATUS_EVENTS['生成解释']
                 
-                # 流式生成回答
+                # 流式生成回答，期间穿插下发后台线程已读取到的结果
                 app.logger.info(f"开始生成解释")
-                for chunk in stream_generate_answer(user_question, results):
-                    yield json.dumps({
-                        'type': 'answer_chunk',
-                        'data': chunk
-                    }) + '\n'
+                for chunk in stream_generate_answer(user_question, streamed_rows.results):
+                    yield {'type': 'answer_chunk', 'data': chunk}
+                    yield from streamed_rows.events(block=False)
+                
+                # 下发剩余结果
+                yield from streamed_rows.events()
+                yield {'type': 'results_end', 'count': streamed_rows.row_count}
+                app.logger.info(f"查询执行完成，返回 {streamed_rows.row_count} 条记录")
                 
                 # 发送完成状态
-                yield json.dumps({
-                    'type': 'status',
-                    'data': '完成'
-                }) + '\n'
+                yield STATUS_EVENTS['完成']
                 
                 # 最后发送完成标记
-                yield json.dumps({
-                    'type': 'done'
-                }) + '\n'
+                yield DONE_EVENT
                 
-                cursor.close()
                 app.logger.info(f"流式查询完成")
             except Exception as e:
                 app.logger.error(f"流式查询过程中发生错误: {str(e)}", exc_info=True)
-                yield json.dumps({
-                    'type': 'error',
-                    'data': f"处理查询时出错: {str(e)}"
-                }) + '\n'
+                yield {'type': 'error', 'data': f"处理查询时出错: {str(e)}"}
                 raise
+            finally:
+                # 先停止后台读取，再关闭游标，清除会话状态后归还连接
+                if streamed_rows:
+                    streamed_rows.close()
+                if cursor:
+                    try:
+                        cursor.close()
+                    except Exception:
+                        pass
+                if connection:
+                    reset_pooled_session(connection)
+                    connection.close()
         
-        return Response(stream_with_context(generate()), 
-                        content_type='application/x-ndjson')
+        return streaming_response(buffered_ndjson(generate()), 'application/x-ndjson')
     
     except mysql.connector.Error as e:
         app.logger.error(f"数据库错误: {str(e)}", exc_info=True)
@@ -651,8 +1003,7 @@ def stream_query():
 def clear_history():
     """清除当前会话的对话历史"""
     session_id = get_session_id()
-    if session_id in conversation_histories:
-        conversation_histories[session_id] = []
+    conversation_histories.pop(session_id, None)
     return jsonify({'success': True})
 
 @app.route('/api/db-structure', methods=['POST'])
@@ -661,12 +1012,11 @@ def get_db_structure():
     """获取数据库结构信息用于可视化"""
     try:
         config = request.json
-        connection = get_or_create_connection(config)
+        with closing(get_or_create_connection(config)) as connection:
+            # 获取增强的数据库结构（可视化不展示示例数据，不逐表查询数据；表结构未变时使用缓存）
+            db_info = get_enhanced_database_structure(connection, include_samples=False)
         
-        # 获取增强的数据库结构
-        db_info = get_enhanced_database_structure(connection)
-        
-        return jsonify({
+        return json_response({
             'success': True,
             'db_structure': db_info
         })
@@ -682,12 +1032,11 @@ def get_table_relationships():
     """获取表关系图谱数据"""
     try:
         config = request.json
-        connection = get_or_create_connection(config)
-        
-        # 分析表关系
-        relationships = analyze_table_relationships(connection)
+        with closing(get_or_create_connection(config)) as connection:
+            # 分析表关系（表结构未变时使用缓存）
+            relationships = analyze_table_relationships(connection)
         
-        return jsonify({
+        return json_response({
             'success': True,
             'relationships': relationships
         })
@@ -705,33 +1054,38 @@ def get_table_data():
         data = request.json
         config = data.get('config')
         table_name = data.get('table')
-        page = data.get('page', 1)
-        limit = data.get('limit', 20)
+        page = int(data.get('page', 1))
+        limit = int(data.get('limit', 20))
         
         if not config or not table_name:
             return jsonify({'error': '缺少必要参数'}), 400
-            
-        connection = get_or_create_connection(config)
-        cursor = connection.cursor(dictionary=True)
-        
-        # 获取总记录数
-        cursor.execute(f"SELECT COUNT(*) as count FROM {table_name}")
-        total = cursor.fetchone()['count']
-        
-        # 计算偏移量
-        offset = (page - 1) * limit
+        if page < 1 or limit < 1:
+            return jsonify({'error': '分页参数无效'}), 400
         
-        # 获取数据
-        cursor.execute(f"SELECT * FROM {table_name} LIMIT {limit} OFFSET {offset}")
-        rows = cursor.fetchall()
-        
-        # 获取表结构
-        cursor.execute(f"DESCRIBE {table_name}")
-        columns = cursor.fetchall()
-        
-        cursor.close()
+        # 表名只能作为标识符转义，分页参数通过占位符传递
+        table = quote_identifier(table_name)
+            
+        with closing(get_or_create_connection(config)) as connection:
+            cursor = connection.cursor()
+            
+            # 获取总记录数
+            cursor.execute(f"SELECT COUNT(*) as count FROM {table}")
+            total = cursor.fetchone()[0]
+            
+            # 计算偏移量
+            offset = (page - 1) * limit
+            
+            # 获取数据
+            cursor.execute(f"SELECT * FROM {table} LIMIT %s OFFSET %s", (limit, offset))
+            rows = fetch_dict_rows(cursor)
+            
+            # 获取表结构
+            cursor.execute(f"DESCRIBE {table}")
+            columns = fetch_dict_rows(cursor)
+            
+            cursor.close()
         
-        return jsonify({
+        return json_response({
             'success': True,
             'data': rows,
             'columns': columns,
@@ -745,6 +1099,13 @@ def get_table_data():
             'error': str(e)
         })
 
+@lru_cache(maxsize=256)
+def build_update_sql(table_name, columns, primary_key):
+    """构建按主键更新一行的参数化UPDATE语句"""
+    set_clause = ', '.join(f"{quote_identifier(column)} = %s" for column in columns)
+    return (f"UPDATE {quote_identifier(table_name)} SET {set_clause} "
+            f"WHERE {quote_identifier(primary_key)} = %s")
+
 @app.route('/api/update-row', methods=['POST'])
 @with_error_handling
 def update_row():
@@ -760,30 +1121,83 @@ def update_row():
         if not all([config, table_name, row_data, primary_key, primary_value]):
             return jsonify({'error': '缺少必要参数'}), 400
             
-        connection = get_or_create_connection(config)
-        cursor = connection.cursor()
-        
-        # 构建更新语句
-        set_clauses = []
-        values = []
+        # 构建更新语句（相同表和列组合的语句模板会被缓存）
+        columns = tuple(row_data.keys())
+        query = build_update_sql(table_name, columns, primary_key)
+        values = [row_data[column] for column in columns]
+        values.append(primary_value)
         
-        for key, value in row_data.items():
-            set_clauses.append(f"{key} = %s")
-            values.append(value)
+        with closing(get_or_create_connection(config)) as connection:
+            # 使用服务端预处理语句（二进制协议）
+            cursor = connection.cursor(prepared=True)
             
-        values.append(primary_value)
+            # 执行更新
+            cursor.execute(query, tuple(values))
+            connection.commit()
+            
+            cursor.close()
+        invalidate_cached_results(config)
         
-        query = f"UPDATE {table_name} SET {', '.join(set_clauses)} WHERE {primary_key} = %s"
+        return jsonify({
+            'success': True,
+            'message': '数据更新成功'
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
+
+@app.route('/api/update-rows', methods=['POST'])
+@with_error_handling
+def update_rows():
+    """
+    批量更新表中的多行数据
+    
+    请求体中的 rows 形如 [{"pk_value": ..., "fields": {列名: 新值}}]，所有行必须更新同一组列；
+    语句只预处理一次，并在同一个事务中批量执行
+    """
+    try:
+        data = request.json
+        config = data.get('config')
+        table_name = data.get('table')
+        primary_key = data.get('primary_key')
+        rows = data.get('rows')
         
-        # 执行更新
-        cursor.execute(query, tuple(values))
-        connection.commit()
+        if not all([config, table_name, primary_key, rows]) or not isinstance(rows, list):
+            return jsonify({'error': '缺少必要参数'}), 400
+        
+        # 所有行必须更新同一组列，才能共用一条语句
+        columns = tuple(rows[0].get('fields') or {})
+        if not columns:
+            return jsonify({'error': '缺少要更新的字段'}), 400
+        column_set = set(columns)
+        params = []
+        for row in rows:
+            fields = row.get('fields') or {}
+            if set(fields) != column_set or row.get('pk_value') is None:
+                return jsonify({'error': '所有行必须包含主键值并更新相同的字段'}), 400
+            params.append(tuple(fields[column] for column in columns) + (row['pk_value'],))
         
-        cursor.close()
+        query = build_update_sql(table_name, columns, primary_key)
+        
+        with closing(get_or_create_connection(config)) as connection:
+            cursor = connection.cursor(prepared=True)
+            try:
+                connection.start_transaction()
+                cursor.executemany(query, params)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                cursor.close()
+        invalidate_cached_results(config)
         
         return jsonify({
             'success': True,
-            'message': '数据更新成功'
+            'message': f'成功更新 {len(params)} 行数据',
+            'updated': len(params)
         })
     except Exception as e:
         return jsonify({
@@ -802,13 +1216,21 @@ def visualize_query():
         
         if not config or not sql_query:
             return jsonify({'error': '缺少必要参数'}), 400
+        if USE_STATEMENT_RE.search(sql_query):
+            return jsonify({'error': '不支持USE语句，请在连接配置中切换数据库'}), 400
             
         connection = get_or_create_connection(config)
-        cursor = connection.cursor(dictionary=True)
-        
-        # 执行查询
-        cursor.execute(sql_query)
-        results = cursor.fetchall()
+        try:
+            cursor = connection.cursor()
+            
+            # 执行查询
+            cursor.execute(sql_query)
+            results = fetch_dict_rows(cursor)
+            cursor.close()
+        finally:
+            # 执行的是客户端提交的SQL，清除会话状态后再归还连接池
+            reset_pooled_session(connection)
+            connection.close()
         
         if not results:
             return jsonify({
@@ -820,9 +1242,8 @@ def visualize_query():
         # 分析结果结构以推荐可视化类型
         visualization_type, chart_data = recommend_visualization(results)
         
-        cursor.close()
-        
-        return jsonify({
+        # 与其他返回查询结果的接口一致，使用orjson序列化（日期时间为ISO 8601格式）
+        return json_response({
             'success': True,
             'results': results,
             'visualization_type': visualization_type,
@@ -869,188 +1290,37 @@ def export_chart():
 @with_error_handling
 def close_connections():
     """关闭当前会话的所有数据库连接"""
-    session_id = get_session_id()
-    if session_id in active_connections:
-        for connection in active_connections[session_id].values():
-            if connection.is_connected():
-                connection.close()
-        active_connections[session_id] = {}
+    # 连接在每个请求结束时已归还连接池，会话不再持有连接
     return jsonify({'success': True})
 
-@app.before_request
 def log_request_info():
-    """记录每个请求的详细信息"""
-    if request.path.startswith('/api/'):
-        app.logger.info("=== 接收到API请求 ===")
-        app.logger.info(f"请求路径: {request.path}")
-        app.logger.info(f"请求方法: {request.method}")
-        app.logger.info(f"请求头: {dict(request.headers)}")
-        
-        # 记录请求参数
-        if request.is_json:
-            app.logger.info(f"JSON数据: {request.json}")
-        else:
-            app.logger.info(f"表单数据: {request.form}")
-            app.logger.info(f"查询参数: {request.args}")
-            
-        # 记录会话ID
-        app.logger.info(f"会话ID: {session.get('session_id', '无')}")
-
-@app.before_request
-def cleanup_old_sessions():
-    """定期清理长时间不活跃的会话"""
-    current_time = time.time()
-    # 每10分钟执行一次清理
-    if not hasattr(app, 'last_cleanup') or current_time - getattr(app, 'last_cleanup', 0) > 600:
-        app.last_cleanup = current_time
-        
-        # 清理超过2小时没有活动的会话
-        # 这里简单实现，实际生产环境应该使用更复杂的会话管理
-        for session_id in list(active_connections.keys()):
-            if session_id not in session:
-                for connection in active_connections[session_id].values():
-                    if connection.is_connected():
-                        connection.close()
-                del active_connections[session_id]
-                if session_id in conversation_histories:
-                    del conversation_histories[session_id]
-
-@app.teardown_appcontext
-def cleanup_connections(exception=None):
-    """应用上下文结束时的清理函数"""
-    try:
-        from flask import has_request_context
-        if has_request_context():
-            session_id = session.get('session_id')
-            if session_id and session_id in active_connections:
-                # 不在这里关闭连接，保持连接池活跃
-                pass
-    except Exception:
-        # 在没有请求上下文的情况下忽略错误
-        pass
-
-def recommend_visualization(results):
-    """
-    根据查询结果推荐合适的可视化类型
-    返回：推荐的可视化类型与处理后的图表数据
-    """
-    if not results:
-        return 'none', {}
-        
-    # 分析返回的列数
-    columns = list(results[0].keys())
-    num_columns = len(columns)
+    """记录每个请求的详细信息（仅在设置环境变量 MYSQL_AI_VERBOSE=1 时注册）"""
+    if not request.path.startswith('/api/') or not app.logger.isEnabledFor(logging.INFO):
+        return
     
-    # 检查是否每列都是数值型
-    numeric_columns = []
-    categorical_columns = []
-    temporal_columns = []
+    app.logger.info("=== 接收到API请求 ===")
+    app.logger.info(f"请求路径: {request.path}")
+    app.logger.info(f"请求方法: {request.method}")
+    app.logger.info(f"请求头: {dict(request.headers)}")
     
-    for col in columns:
-        # 检查所有行的这个列的值
-        values = [row[col] for row in results if row[col] is not None]
-        if not values:
-            continue
-            
-        # 检查是否可能是日期列
-        if isinstance(values[0], (str)) and len(values) > 0:
-            # 尝试检测日期格式列
-            date_patterns = [
-                r'\d{4}-\d{2}-\d{2}',  # YYYY-MM-DD
-                r'\d{2}/\d{2}/\d{4}',  # MM/DD/YYYY
-                r'\d{4}/\d{2}/\d{2}'   # YYYY/MM/DD
-            ]
-            if any(re.search(pattern, values[0]) for pattern in date_patterns):
-                temporal_columns.append(col)
-                continue
-        
-        # 检查数值型
-        if all(isinstance(val, (int, float)) for val in values):
-            numeric_columns.append(col)
-        else:
-            categorical_columns.append(col)
-    
-    # 根据列特性推荐可视化类型
-    chart_data = {}
-    
-    # 情况1: 一个分类列和一个数值列 -> 柱状图
-    if len(categorical_columns) == 1 and len(numeric_columns) == 1:
-        cat_col = categorical_columns[0]
-        num_col = numeric_columns[0]
-        
-        labels = [str(row[cat_col]) for row in results]
-        values = [row[num_col] for row in results]
-        
-        chart_data = {
-            'labels': labels,
-            'datasets': [{
-                'label': num_col,
-                'data': values
-            }]
-        }
-        return 'bar', chart_data
-        
-    # 情况2: 两个数值列 -> 散点图
-    elif len(numeric_columns) >= 2:
-        x_col = numeric_columns[0]
-        y_col = numeric_columns[1]
-        
-        points = [{'x': row[x_col], 'y': row[y_col]} for row in results]
-        
-        chart_data = {
-            'datasets': [{
-                'label': f'{x_col} vs {y_col}',
-                'data': points
-            }]
-        }
-        return 'scatter', chart_data
-        
-    # 情况3: 一个时间列和一个数值列 -> 折线图
-    elif len(temporal_columns) >= 1 and len(numeric_columns) >= 1:
-        time_col = temporal_columns[0]
-        num_col = numeric_columns[0]
-        
-        labels = [str(row[time_col]) for row in results]
-        values = [row[num_col] for row in results]
-        
-        chart_data = {
-            'labels': labels,
-            'datasets': [{
-                'label': num_col,
-                'data': values
-            }]
-        }
-        return 'line', chart_data
-        
-    # 情况4: 只有一个数值列 -> 饼图
-    elif len(numeric_columns) == 1 and len(results) <= 10:
-        num_col = numeric_columns[0]
-        
-        if len(categorical_columns) > 0:
-            cat_col = categorical_columns[0]
-            labels = [str(row[cat_col]) for row in results]
-        else:
-            labels = [f'Item {i+1}' for i in range(len(results))]
-            
-        values = [row[num_col] for row in results]
-        
-        chart_data = {
-            'labels': labels,
-            'datasets': [{
-                'data': values
-            }]
-        }
-        return 'pie', chart_data
-        
-    # 情况5: 表格数据 -> 表格视图
+    # 记录请求参数（直接记录截断后的原始请求体，不重复解析JSON）
+    if request.is_json:
+        app.logger.info(f"JSON数据: {request.get_data(as_text=True)[:REQUEST_LOG_BODY_LIMIT]}")
     else:
-        return 'table', {'data': results}
+        app.logger.info(f"表单数据: {request.form}")
+        app.logger.info(f"查询参数: {request.args}")
+        
+    # 记录会话ID
+    app.logger.info(f"会话ID: {session.get('session_id', '无')}")
+
+if VERBOSE_REQUEST_LOGGING:
+    app.before_request(log_request_info)
 
 @app.route('/api/debug-logs', methods=['GET'])
 def get_debug_logs():
     """获取最近的调试日志"""
-    logs = memory_handler.get_logs()
-    memory_handler.clear()  # 清除日志，避免无限增长
+    # 读取并清空日志是一次交换操作，两步之间产生的日志不会丢失
+    logs = memory_handler.drain()
     return jsonify({'logs': logs})
 
 @app.after_request
@@ -1078,34 +1348,123 @@ def test_llm_connection():
             'error': str(e)
         }), 500
 
+def iter_query_row_chunks(cursor, columnar):
+    """按批读取 /api/query 的结果：列式格式直接使用元组行，否则转换为字典行"""
+    if not columnar:
+        return iter_dict_row_chunks(cursor, QUERY_FETCH_SIZE)
+    if not cursor.description:
+        return iter(())
+    return iter(partial(cursor.fetchmany, QUERY_FETCH_SIZE), [])
+
+def make_query_release(connection, cursor):
+    """
+    返回关闭游标、清除会话状态并归还连接的函数，多次调用时只执行一次
+
+    流式输出结束时和响应关闭时都会调用：响应在开始输出前就被关闭时生成器不会运行，
+    只能由 response.call_on_close 负责归还连接
+    """
+    released = False
+    
+    def release():
+        nonlocal released
+        if released:
+            return
+        released = True
+        try:
+            cursor.close()
+        except Exception as e:
+            app.logger.error("Query - 关闭游标失败: %s", e)
+        try:
+            reset_pooled_session(connection)
+            connection.close()
+        except Exception as e:
+            app.logger.error("Query - 关闭连接失败: %s", e)
+    
+    return release
+
+def stream_query_rows(release, rows, chunks, start_time, columns=None):
+    """
+    /api/query 大结果集的分块JSON输出，每次只在内存中保留一批行
+    
+    rows 为已读取的第一批，chunks 提供后续批次；列式格式时 columns 为列名列表。
+    行数在读完后才知道，因此先输出 rows 数组，最后补上 rowCount、success 等字段；
+    中途读取失败时以 success=false 和错误信息结束，保证输出仍是合法的JSON。
+    输出结束或客户端断开时调用 release（make_query_release）关闭游标并归还连接
+    """
+    row_count = 0
+    try:
+        if columns is None:
+            yield b'{"result":{"rows":['
+        else:
+            yield b'{"result":{"columns":' + orjson.dumps(columns) + b',"rows":['
+        separator = b''
+        while rows:
+            # 整批编码后去掉数组的方括号，拼接到输出的 rows 数组中
+            yield separator + orjson.dumps(rows, default=query_json_default, option=JSON_OPTIONS)[1:-1]
+            separator = b','
+            row_count += len(rows)
+            rows = next(chunks, None)
+        tail = {'success': True, 'execution_time': time.time() - start_time}
+        app.logger.info("Query - SELECT查询流式输出完成，返回行数: %s", row_count)
+    except Exception as e:
+        app.logger.error("Query - 流式读取结果失败: %s", e)
+        tail = {'success': False, 'error': f'SQL执行错误: {str(e)}'}
+    finally:
+        release()
+    yield b'],"rowCount":%d},' % row_count + orjson.dumps(tail)[1:]
+
 @app.route('/api/query', methods=['POST'])
 @with_error_handling
 def query():
     """执行SQL查询并返回结果"""
     connection = None
     cursor = None
+    cache_key = None
+    cache_claim = None
+    cacheable_result = None
     
     try:
         data = request.json
         sql = data.get('sql', '')
         config = data.get('config', {})
+        # format=columns 时返回列名列表和元组行，避免每行重复列名
+        columnar = data.get('format') == 'columns'
+        # 可选的查询参数，对应SQL中的 %s 占位符
+        params = data.get('params') or None
         
         app.logger.info("=====================")
-        app.logger.info(f"收到 /api/query 请求: {sql}")
-        app.logger.info(f"配置信息: {json.dumps({k: ('***' if k == 'password' else v) for k, v in config.items()})}")
+        app.logger.info("收到 /api/query 请求: %s", sql)
+        app.logger.info("配置信息: %s", MaskedConfig(config))
         
         if not sql or not config:
             app.logger.warning("Query - 缺少SQL或数据库配置")
-            return jsonify({'success': False, 'error': '缺少SQL或数据库配置'})
+            return json_response({'success': False, 'error': '缺少SQL或数据库配置'})
+        if USE_STATEMENT_RE.search(sql):
+            app.logger.warning("Query - 检测到USE语句，已拒绝: %s", sql)
+            return json_response({'success': False, 'error': '不支持USE语句，请在连接配置中切换数据库'})
             
         # 记录搜索历史
         if 'user_id' in session:
             user_id = session['user_id']
             save_query_history(user_id, sql)
         
-        # 直接创建新连接
+        # 结果确定的只读查询先查结果缓存，命中时无需访问数据库
+        keyword = get_statement_keyword(sql)
+        if keyword in READ_ONLY_STATEMENTS and not NONDETERMINISTIC_SQL_RE.search(sql):
+            cache_key = (get_pool_key(config), normalize_sql(sql), params and orjson.dumps(params), columnar)
+            cached_result, cache_claim = claim_query_result(cache_key)
+            if cached_result is not None:
+                app.logger.info("Query - 命中查询结果缓存")
+                return json_response({
+                    'success': True,
+                    'result': cached_result,
+                    'execution_time': 0,
+                    'cached': True
+                }, default=query_json_default)
+        
+        # 从连接池借出连接
         try:
-            app.logger.info("Query - 正在创建新的数据库连接...")
+            app.logger.info("Query - 正在从连接池获取数据库连接...")
             
             # 验证配置必要字段
             required_fields = ['username', 'password', 'host', 'port']
@@ -1113,109 +1472,95 @@ def query():
                 if field not in config or not config[field]:
                     raise ValueError(f"配置缺少必要字段: {field}")
                     
-            connection = mysql.connector.connect(
-                user=config['username'],
-                password=config['password'],
-                host=config['host'],
-                port=int(config['port']),
-                database=config.get('database', ''),
-                connect_timeout=30,
-                use_pure=True,  # 使用纯Python实现，提高兼容性
-                autocommit=False
-            )
-            
-            # 确认连接有效
-            if not connection.is_connected():
-                raise Exception("连接创建后状态检查失败")
-                
-            app.logger.info("Query - 数据库连接创建成功")
-            
-            # 预热连接
-            test_cursor = connection.cursor()
-            test_cursor.execute("SELECT 1")
-            test_cursor.fetchall()
-            test_cursor.close()
-            app.logger.info("Query - 连接预热测试成功")
+            connection = get_pooled_connection(config)
+            app.logger.info("Query - 数据库连接获取成功")
             
         except Exception as e:
-            app.logger.error(f"Query - 连接失败: {str(e)}")
-            if connection:
-                try:
-                    connection.close()
-                except:
-                    pass
-            return jsonify({
+            app.logger.error("Query - 连接失败: %s", e)
+            return json_response({
                 'success': False,
                 'error': f'数据库连接错误: {str(e)}'
             })
         
         # 执行SQL
         try:
-            cursor = connection.cursor(dictionary=True)
+            # 普通游标返回元组行，列名只取一次，不让驱动为每行构建字典
+            cursor = connection.cursor()
             start_time = time.time()
             
             # 记录正在执行的SQL
-            app.logger.info(f"Query - 执行SQL: {sql}")
+            app.logger.info("Query - 执行SQL: %s", sql)
             
-            cursor.execute(sql)
+            cursor.execute(sql, params)
             
             # 对于非SELECT语句，获取影响的行数
-            if sql.strip().upper().startswith(('INSERT', 'UPDATE', 'DELETE', 'CREATE', 'ALTER', 'DROP')):
+            if keyword in WRITE_STATEMENTS:
                 result = {'rowCount': cursor.rowcount, 'rows': []}
                 connection.commit()
-                app.logger.info(f"Query - 非SELECT查询执行成功，影响行数: {cursor.rowcount}")
+                invalidate_cached_results(config)
+                app.logger.info("Query - 非SELECT查询执行成功，影响行数: %s", cursor.rowcount)
             else:
-                rows = cursor.fetchall()
-                # 将MySQL类型转换为JSON可序列化类型
-                processed_rows = []
-                for row in rows:
-                    processed_row = {}
-                    for key, value in row.items():
-                        if isinstance(value, (datetime.date, datetime.datetime)):
-                            processed_row[key] = value.isoformat()
-                        elif isinstance(value, decimal.Decimal):
-                            processed_row[key] = float(value)
-                        else:
-                            processed_row[key] = value
-                    processed_rows.append(processed_row)
+                # 日期时间由orjson原生序列化为ISO字符串，DECIMAL 由 query_json_default 转为浮点数
+                columns = list(cursor.column_names) if columnar else None
+                chunks = iter_query_row_chunks(cursor, columnar)
+                processed_rows = next(chunks, [])
+                if len(processed_rows) == QUERY_FETCH_SIZE:
+                    # 一批读不完：游标和连接交给流式输出和响应关闭回调负责归还，结果不进入缓存
+                    app.logger.info("Query - 结果集较大，改为分块流式输出")
+                    release = make_query_release(connection, cursor)
+                    response = streaming_response(
+                        stream_query_rows(release, processed_rows, chunks, start_time, columns), 'application/json'
+                    )
+                    response.call_on_close(release)
+                    cursor = connection = None
+                    return response
                 
                 result = {'rowCount': len(processed_rows), 'rows': processed_rows}
-                app.logger.info(f"Query - SELECT查询执行成功，返回行数: {len(processed_rows)}")
+                if columnar:
+                    result['columns'] = columns
+                if cache_key is not None:
+                    cacheable_result = result
+                app.logger.info("Query - SELECT查询执行成功，返回行数: %s", len(processed_rows))
                 
             execution_time = time.time() - start_time
             
-            return jsonify({
+            return json_response({
                 'success': True,
                 'result': result,
                 'execution_time': execution_time
-            })
+            }, default=query_json_default)
         except Exception as e:
             if connection:
                 try:
                     connection.rollback()
                 except:
                     pass
-            app.logger.error(f"Query - 执行SQL失败: {str(e)}")
-            return jsonify({
+            app.logger.error("Query - 执行SQL失败: %s", e)
+            return json_response({
                 'success': False,
                 'error': f'SQL执行错误: {str(e)}'
             })
     finally:
+        # 唤醒等待相同查询的请求（查询成功时同时写入缓存）
+        if cache_claim is not None:
+            release_query_claim(cache_key, cache_claim, cacheable_result)
+        
         # 确保资源释放
         if cursor:
             try:
                 cursor.close()
                 app.logger.info("Query - 游标已关闭")
             except Exception as e:
-                app.logger.error(f"Query - 关闭游标失败: {str(e)}")
+                app.logger.error("Query - 关闭游标失败: %s", e)
                 
         if connection:
+            # 清除会话状态后直接归还连接池，不先调用 is_connected()（它会向服务器发送一次 ping）
             try:
-                if connection.is_connected():
-                    connection.close()
-                    app.logger.info("Query - 数据库连接已关闭")
+                reset_pooled_session(connection)
+                connection.close()
+                app.logger.info("Query - 数据库连接已归还连接池")
             except Exception as e:
-                app.logger.error(f"Query - 关闭连接失败: {str(e)}")
+                app.logger.error("Query - 关闭连接失败: %s", e)
 
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
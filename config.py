@@ -32,6 +32,7 @@
     - 支持通过环境变量覆盖默认值
 """
 import os
+import re
 import logging
 
 # 设置日志记录器
@@ -51,18 +52,31 @@ if API_KEY:
     logger.info(f"API_KEY: {masked_key} (已脱敏)")
 else:
     logger.warning("未配置API_KEY，可能会导致API调用失败")
-    
-# API测试功能
-def test_api_connection():
-    """测试API连接是否正常工作"""
-    try:
+
+# 非ASCII字符（用于过滤测试响应中的emoji等字符）
+NON_ASCII_RE = re.compile(r'[^\x00-\x7f]+')
+
+# API测试使用的客户端，首次测试时创建，之后复用其HTTP连接池
+_test_client = None
+
+def get_test_client():
+    """惰性创建并缓存API测试使用的OpenAI客户端"""
+    global _test_client
+    if _test_client is None:
         from openai import OpenAI
         # 使用超时设置创建客户端
-        client = OpenAI(
+        _test_client = OpenAI(
             api_key=API_KEY, 
             base_url=BASE_URL,
             timeout=30.0  # 增加超时时间到30秒
         )
+    return _test_client
+    
+# API测试功能
+def test_api_connection():
+    """测试API连接是否正常工作"""
+    try:
+        client = get_test_client()
         
         # 简单测试调用，使用更简短的提示和更低的温度
         response = client.chat.completions.create(
@@ -75,7 +89,7 @@ def test_api_connection():
         if response and hasattr(response, 'choices') and len(response.choices) > 0:
             # 移除可能包含的emoji和其他非ASCII字符
             content = response.choices[0].message.content
-            content_safe = content.encode('ascii', 'ignore').decode('ascii')
+            content_safe = NON_ASCII_RE.sub('', content)
             # 如果过滤后为空，使用简单文本
             if not content_safe.strip():
                 content_safe = "内容包含非ASCII字符"
@@ -0,0 +1,181 @@
+"""
+数据库连接模块 (connection.py)
+===========================
+
+该模块负责管理MySQL数据库连接池，避免每个请求都重新进行TCP握手和认证。主要功能包括：
+
+核心功能：
+    1. 连接池管理：按连接配置缓存 MySQLConnectionPool 实例，超出数量上限时关闭最久未用的连接池
+    2. 连接借还：从连接池借出连接，close() 时归还连接池而不是断开
+    3. 容量兜底：连接池耗尽时临时创建独立连接
+    4. 存活检查：最近确认可用的连接在短时间内不再重复 ping 服务器
+    5. 会话清理：执行过任意SQL的连接归还前清除会话状态
+
+主要组件：
+    - get_pool(): 获取或创建与配置对应的连接池
+    - get_pooled_connection(): 从连接池借出一个连接
+    - close_idle_connections(): 断开被淘汰的连接池中的空闲连接
+    - mark_connection_alive(): 记录连接刚被确认可用
+    - is_connection_alive(): 检查连接是否可用，近期确认过时直接返回
+    - reset_pooled_session(): 清除连接上残留的会话状态
+
+技术特点：
+    - 连接池以配置摘要为键，不同用户/数据库互不干扰
+    - 连接池本身是线程安全的，借还连接无需额外加锁
+    - 每个连接池创建时即建立 POOL_SIZE 个连接，缓存的连接池数量受 MAX_POOLS 限制，避免耗尽 max_connections
+    - 池内连接开启 autocommit，避免归还后残留事务快照
+
+依赖项：
+    - mysql.connector.pooling: MySQL连接池
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import mysql.connector
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError
+
+# 每个连接池的连接数
+POOL_SIZE = 16
+# 连接超时时间（秒）
+CONNECT_TIMEOUT = 10
+
+# 连接被确认可用后，在该时间（秒）内视为存活，不再 ping 服务器
+CONNECTION_ALIVE_TTL = 5.0
+
+# 最多缓存的连接池数量（每个连接池占用 POOL_SIZE 个服务器连接）
+MAX_POOLS = 4
+
+# 区分连接池的配置字段（密码也参与区分，避免不同密码共用已认证的连接池）
+POOL_KEY_FIELDS = ('username', 'password', 'host', 'port', 'database')
+
+# 按配置字段元组缓存的连接池，按最近使用顺序排列
+_pools = OrderedDict()
+# 保护连接池的创建、淘汰和使用顺序，借还连接由连接池自身保证线程安全
+_pools_lock = threading.Lock()
+
+
+def build_connection_args(config):
+    """将前端传入的配置转换为 mysql.connector 的连接参数"""
+    return {
+        'user': config['username'],
+        'password': config['password'],
+        'host': config['host'],
+        'port': int(config['port']),
+        'database': config.get('database') or None,
+        'connect_timeout': CONNECT_TIMEOUT,
+        'autocommit': True,
+        # 流式读取中途出错时，自动丢弃未读完的结果，避免归还的连接不可用
+        'consume_results': True,
+    }
+
+
+def get_pool_key(config):
+    """连接池缓存键：配置字段组成的元组，可直接哈希"""
+    return tuple(config.get(field) for field in POOL_KEY_FIELDS)
+
+
+def get_pool_name(pool_key):
+    """根据缓存键生成连接池名称（密码只参与摘要，不会出现在名称中）"""
+    key = '\x00'.join(str(value or '') for value in pool_key)
+    return 'mysql_ai_' + hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+
+def get_pool(config):
+    """
+    获取或创建与配置对应的连接池
+
+    创建连接池时会立即建立 POOL_SIZE 个连接，这一步在锁外进行，不阻塞其他配置借出连接；
+    并发创建同一配置的连接池时保留先写入的一个，其余的关闭。
+    缓存的连接池超过 MAX_POOLS 个时，关闭最久未使用的连接池中的空闲连接；
+    它借出中的连接归还后不再被借出，随连接池对象一起释放
+    """
+    pool_key = get_pool_key(config)
+    with _pools_lock:
+        pool = _pools.get(pool_key)
+        if pool is not None:
+            _pools.move_to_end(pool_key)
+            return pool
+
+    new_pool = pooling.MySQLConnectionPool(
+        pool_name=get_pool_name(pool_key),
+        pool_size=POOL_SIZE,
+        pool_reset_session=False,
+        **build_connection_args(config)
+    )
+    stale_pools = []
+    with _pools_lock:
+        pool = _pools.get(pool_key)
+        if pool is None:
+            pool = _pools[pool_key] = new_pool
+            while len(_pools) > MAX_POOLS:
+                stale_pools.append(_pools.popitem(last=False)[1])
+        else:
+            _pools.move_to_end(pool_key)
+            stale_pools.append(new_pool)
+
+    for stale_pool in stale_pools:
+        close_idle_connections(stale_pool)
+    return pool
+
+
+def close_idle_connections(pool):
+    """通过连接池公开的借出接口逐个取出空闲连接并直接断开（不归还），直到连接池取空"""
+    while True:
+        try:
+            connection = pool.get_connection()
+        except mysql.connector.Error:
+            # PoolError 表示已取空；重连失败的连接已由连接池放回，同样停止
+            return
+        connection.disconnect()
+
+
+def get_pooled_connection(config):
+    """
+    从连接池借出一个连接
+
+    返回的连接调用 close() 时会归还连接池；连接池耗尽时退化为独立连接，
+    close() 时直接断开。
+    """
+    try:
+        # 连接池借出连接前已检查过连接是否可用
+        connection = get_pool(config).get_connection()
+    except PoolError:
+        connection = mysql.connector.connect(**build_connection_args(config))
+    mark_connection_alive(connection)
+    return connection
+
+
+def mark_connection_alive(connection):
+    """记录连接刚被确认可用（刚建立、刚借出或刚成功执行语句）"""
+    connection._last_alive_at = time.monotonic()
+
+
+def is_connection_alive(connection):
+    """
+    检查连接是否可用
+
+    CONNECTION_ALIVE_TTL 秒内确认过可用的连接直接视为存活，否则调用 is_connected() ping 服务器
+    """
+    if time.monotonic() - getattr(connection, '_last_alive_at', 0.0) < CONNECTION_ALIVE_TTL:
+        return True
+    if not connection.is_connected():
+        return False
+    mark_connection_alive(connection)
+    return True
+
+
+def reset_pooled_session(connection):
+    """
+    清除连接上残留的会话状态（用户变量、会话变量、临时表、表锁和 GET_LOCK 锁、未提交的事务）
+
+    连接池关闭了 pool_reset_session 以免每次归还都多一次往返，执行用户任意SQL的接口在归还连接前
+    调用本函数；清除失败时断开连接，连接池下次借出时会重新连接
+    """
+    try:
+        connection.cmd_reset_connection()
+    except mysql.connector.Error:
+        connection.disconnect()
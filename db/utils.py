@@ -16,6 +16,17 @@
     - display_table_structure(): 展示数据库表结构
     - interactive_shell(): 提供交互式SQL执行环境
     - analyze_table_relationships(): 分析表之间的关系
+    - fetch_schema_metadata(): 通过 information_schema 批量获取列、主键、外键、索引和估算行数
+    - fetch_table_row_estimates(): 通过 information_schema 批量获取各表的估算行数
+    - format_db_structure_for_prompt(): 将增强的数据库结构格式化为提示词文本
+    - get_db_structure_prompt_sections(): 将增强的数据库结构拆分为按表取舍的提示词片段
+    - invalidate_schema_cache(): 数据修改后丢弃结构缓存
+    - quote_identifier(): 转义表名、列名等SQL标识符
+    - get_statement_keyword(): 提取SQL语句的首个关键字
+    - fetch_dict_rows(): 将普通游标结果转换为字典列表
+    - get_db_and_tables(): 一次查询获取当前数据库名称和所有表名
+    - get_schema_fingerprint(): 计算当前数据库表结构的指纹
+    - iter_dict_row_chunks(): 分批读取游标结果
 
 工作流程：
     1. 数据库结构分析
@@ -51,217 +62,475 @@
 依赖项：
     - mysql.connector: MySQL数据库连接
     - tabulate: 表格格式化输出
+    - orjson: 解析 JSON 格式的执行计划
     - random: 随机数生成
 """
 
+import hashlib
 import mysql.connector
+import orjson
 from tabulate import tabulate
 import random
-import json
-from collections import defaultdict
 import re
+import sys
+import threading
+import time
+from collections import defaultdict, Counter
+from itertools import chain
+from contextlib import closing
+
+# 表结构分析结果缓存的有效期（秒）和最大条目数
+SCHEMA_CACHE_TTL = 300
+SCHEMA_CACHE_MAX_ENTRIES = 128
+# 结构缓存，键为 (类别, 服务器地址, 端口, 用户, 数据库名, 表结构版本, 表结构指纹)，值为 (过期时间, 结果)
+_schema_cache = {}
+_schema_cache_lock = threading.Lock()
+
+# 只读（返回结果集、不修改数据）语句的首个关键字；WITH 语句按其主语句的动词判断
+READ_ONLY_STATEMENTS = frozenset(('select', 'show', 'describe', 'desc', 'explain'))
+# WITH 语句的主语句动词：括号外出现的第一个语句关键字；字符串和带引号的标识符整体跳过
+WITH_MAIN_VERB_RE = re.compile(
+    r"""'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`|[()]|\b(select|insert|replace|update|delete|table|values)\b""",
+    re.IGNORECASE
+)
+# 提取首个关键字时最多检查的字符数，避免对整条SQL做切分和大小写转换
+STATEMENT_KEYWORD_SCAN = 16
+
+# 交互式Shell每次读取并显示的行数，显示一页后询问是否继续
+SHELL_PAGE_ROWS = 1000
+
+# 每次多语句查询采集示例数据的表数量
+SAMPLE_BATCH_TABLES = 50
+
+# 当前数据库名称及其所有表名（LEFT JOIN 保证库中没有表时也能返回库名），需使用字典游标读取
+SCHEMA_PROLOGUE_SQL = """
+    SELECT d.db AS current_db, t.TABLE_NAME AS table_name
+    FROM (SELECT DATABASE() AS db) AS d
+    LEFT JOIN information_schema.TABLES AS t ON t.TABLE_SCHEMA = d.db
+    ORDER BY t.TABLE_NAME
+"""
+# 当前数据库和表名在连接对象上的缓存时间（秒）
+SCHEMA_PROLOGUE_TTL = 5.0
+
+# 表结构指纹的数据来源：当前库所有表的列名和列类型，只随表结构变化
+SCHEMA_FINGERPRINT_SQL = """
+    SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE
+    FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE()
+    ORDER BY TABLE_NAME, ORDINAL_POSITION
+"""
+
+# 表结构版本：表数量与最近的建表/更新时间，DDL 后随之变化
+SCHEMA_VERSION_SQL = """
+    SELECT COUNT(*) AS table_count, MAX(CREATE_TIME) AS created, MAX(UPDATE_TIME) AS updated
+    FROM information_schema.TABLES
+    WHERE TABLE_SCHEMA = %s
+"""
+
+def get_statement_keyword(sql_query):
+    """
+    提取SQL语句的首个关键字（小写），只检查开头的少量字符
+
+    WITH 开头的语句返回主语句的动词，WITH ... DELETE 等修改语句不会被当作只读语句
+    """
+    tokens = sql_query.lstrip(' \t\r\n(')[:STATEMENT_KEYWORD_SCAN].split(None, 1)
+    keyword = tokens[0].lower() if tokens else ''
+    return get_with_main_verb(sql_query) if keyword == 'with' else keyword
+
+def get_with_main_verb(sql_query):
+    """找出 WITH 语句中公用表表达式之后的主语句动词（小写），无法识别时返回 'with'"""
+    depth = 0
+    for match in WITH_MAIN_VERB_RE.finditer(sql_query):
+        token = match.group()
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif match.group(1) and depth == 0:
+            return match.group(1).lower()
+    return 'with'
+
+def quote_identifier(name):
+    """将表名、列名转义为反引号包裹的MySQL标识符，防止拼接SQL时被注入"""
+    if not isinstance(name, str) or not name or '\x00' in name:
+        raise ValueError(f"无效的标识符: {name!r}")
+    return '`' + name.replace('`', '``') + '`'
+
+def fetch_dict_rows(cursor):
+    """
+    将普通游标的结果集转换为字典列表
+
+    列名只驻留一次并在所有行之间复用，避免字典游标逐行重新创建和哈希列名字符串
+    """
+    columns = [sys.intern(desc[0]) for desc in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def iter_dict_row_chunks(cursor, size=500):
+    """按批次从游标读取结果并转换为字典列表，适用于非缓冲游标的流式读取"""
+    if not cursor.description:
+        return
+    columns = [sys.intern(desc[0]) for desc in cursor.description]
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            break
+        yield [dict(zip(columns, row)) for row in rows]
+
+def get_db_and_tables(connection, cursor, schema_fingerprint=None):
+    """
+    获取当前数据库名称和其中的所有表名，返回 (current_db, tables)；未选择数据库时 current_db 为 None
+
+    两者由一次查询得到；结果在连接对象上缓存 SCHEMA_PROLOGUE_TTL 秒，
+    同一连接上接连调用多个结构分析函数时不再重复查询。
+    传入表结构指纹时，只复用在相同指纹下得到的结果
+    """
+    cached = getattr(connection, '_schema_prologue_cache', None)
+    if (cached is not None and time.monotonic() - cached[2] < SCHEMA_PROLOGUE_TTL
+            and cached[3] == schema_fingerprint):
+        return cached[0], cached[1]
+    
+    cursor.execute(SCHEMA_PROLOGUE_SQL)
+    rows = cursor.fetchall()
+    current_db = rows[0]['current_db'] if rows else None
+    tables = [row['table_name'] for row in rows if row['table_name'] is not None]
+    connection._schema_prologue_cache = (current_db, tables, time.monotonic(), schema_fingerprint)
+    return current_db, tables
+
+def get_schema_fingerprint(connection):
+    """
+    计算当前数据库表结构的 64 位 BLAKE2b 指纹（十六进制字符串）
+
+    只覆盖表名、列名和列类型，数据和示例行变化时指纹不变；结果逐行读取并送入哈希，不整体缓存
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    with closing(connection.cursor(buffered=False)) as cursor:
+        cursor.execute(SCHEMA_FINGERPRINT_SQL)
+        for row in cursor:
+            digest.update('\x00'.join(map(str, row)).encode('utf-8') + b'\n')
+    return digest.hexdigest()
+
+def get_schema_cache_key(connection, cursor, kind, current_db, schema_fingerprint=None):
+    """
+    查询表结构版本（一次轻量的 information_schema 查询），组成结构缓存的键
+
+    表结构版本不反映只修改列的 DDL（如 ALGORITHM=INSTANT 的 ADD COLUMN），
+    调用方已计算表结构指纹时一并加入缓存键
+    """
+    cursor.execute(SCHEMA_VERSION_SQL, (current_db,))
+    version = tuple(cursor.fetchone().values())
+    return (kind, connection.server_host, connection.server_port, connection.user, current_db, version, schema_fingerprint)
+
+def get_cached_schema(key):
+    """读取未过期的结构缓存，不存在时返回 None"""
+    with _schema_cache_lock:
+        entry = _schema_cache.get(key)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+def store_cached_schema(key, value):
+    """写入结构缓存，已满时先清理过期条目，仍然已满则丢弃最早写入的条目"""
+    now = time.monotonic()
+    with _schema_cache_lock:
+        if len(_schema_cache) >= SCHEMA_CACHE_MAX_ENTRIES:
+            for stale_key in [k for k, (expire_at, _) in _schema_cache.items() if expire_at <= now]:
+                del _schema_cache[stale_key]
+            if len(_schema_cache) >= SCHEMA_CACHE_MAX_ENTRIES:
+                del _schema_cache[next(iter(_schema_cache))]
+        _schema_cache[key] = (now + SCHEMA_CACHE_TTL, value)
+
+def invalidate_schema_cache(host, port, user):
+    """数据被修改后，丢弃该服务器和用户下的所有结构缓存（样例数据和行数已过时）"""
+    with _schema_cache_lock:
+        for key in [k for k in _schema_cache if k[1:4] == (host, port, user)]:
+            del _schema_cache[key]
 
 def get_database_structure_with_samples(connection):
     """
     获取数据库结构和示例数据，返回格式化的字符串
     """
     try:
-        cursor = connection.cursor(dictionary=True)  # 使用字典游标
+        # 使用非缓冲的字典游标，示例数据逐行读取，不在驱动中整体缓存
+        with closing(connection.cursor(dictionary=True, buffered=False)) as cursor:
         
-        # 获取当前数据库名称
-        cursor.execute("SELECT DATABASE()")
-        current_db = cursor.fetchone()['DATABASE()']
-        if not current_db:
-            return "未选择数据库，请先选择数据库"
+            # 获取当前数据库名称和所有表
+            current_db, tables = get_db_and_tables(connection, cursor)
+            if not current_db:
+                return "未选择数据库，请先选择数据库"
         
-        # 获取所有表
-        cursor.execute("SHOW TABLES")
-        tables = [table[f'Tables_in_{current_db}'] for table in cursor.fetchall()]
+            # 一次参数化查询获取所有表的列信息，按表名分组
+            table_columns = defaultdict(list)
+            cursor.execute(SCHEMA_COLUMNS_SQL, (current_db,))
+            for col in cursor:
+                table_columns[col['table_name']].append(col)
         
-        structure_parts = [f"数据库名称: {current_db}\n"]
+            structure_parts = [f"数据库名称: {current_db}\n"]
         
-        for table_name in tables:
-            # 获取表结构
-            cursor.execute(f"SHOW CREATE TABLE {table_name}")
-            create_table = cursor.fetchone()['Create Table']
-            
-            # 获取列信息
-            cursor.execute(f"DESCRIBE {table_name}")
-            columns = cursor.fetchall()
-            
-            # 获取示例数据
-            cursor.execute(f"SELECT * FROM {table_name} LIMIT 3")
-            samples = cursor.fetchall()
-            
-            # 格式化表信息
-            table_info = [f"\n表名: {table_name}"]
-            table_info.append("\n列信息:")
-            for col in columns:
-                col_desc = f"  - {col['Field']} ({col['Type']})"
-                if col['Key'] == 'PRI':
-                    col_desc += " [主键]"
-                if col['Key'] == 'MUL':
-                    col_desc += " [外键]"
-                table_info.append(col_desc)
+            for table_name in tables:
+                # 格式化表信息
+                table_info = [f"\n表名: {table_name}"]
+                table_info.append("\n列信息:")
+                for col in table_columns[table_name]:
+                    col_desc = f"  - {col['name']} ({col['type']})"
+                    if col['key'] == 'PRI':
+                        col_desc += " [主键]"
+                    if col['key'] == 'MUL':
+                        col_desc += " [外键]"
+                    table_info.append(col_desc)
             
-            if samples:
-                table_info.append("\n示例数据:")
-                for sample in samples:
-                    sample_str = "  "
-                    for key, value in sample.items():
-                        sample_str += f"{key}: {value}, "
-                    table_info.append(sample_str.rstrip(", "))
+                # 获取示例数据，逐行读取并格式化
+                cursor.execute(f"SELECT * FROM {quote_identifier(table_name)} LIMIT 3")
+                sample_lines = []
+                for sample in cursor:
+                    sample_lines.append("  " + ", ".join(f"{key}: {value}" for key, value in sample.items()))
+                if sample_lines:
+                    table_info.append("\n示例数据:")
+                    table_info.extend(sample_lines)
             
-            structure_parts.append("\n".join(table_info))
+                structure_parts.append("\n".join(table_info))
         
-        return "\n".join(structure_parts)
+            return "\n".join(structure_parts)
         
     except Exception as e:
         print(f"获取数据库结构时出错：{e}")
         return "数据库结构获取失败，请检查数据库连接"
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
 
-def get_enhanced_database_structure(connection):
+# 批量读取表结构元数据的 information_schema 查询，按表名分组后组装各表信息
+SCHEMA_COLUMNS_SQL = """
+    SELECT TABLE_NAME AS table_name, COLUMN_NAME AS name, COLUMN_TYPE AS type,
+           IS_NULLABLE AS nullable, COLUMN_KEY AS `key`, COLUMN_DEFAULT AS `default`, EXTRA AS extra
+    FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = %s
+    ORDER BY TABLE_NAME, ORDINAL_POSITION
+"""
+# 单表列信息，列名与 DESCRIBE 的输出一致；参数化后所有表共用同一条SQL文本
+TABLE_COLUMNS_SQL = """
+    SELECT COLUMN_NAME AS Field, COLUMN_TYPE AS Type, IS_NULLABLE AS `Null`,
+           COLUMN_KEY AS `Key`, COLUMN_DEFAULT AS `Default`, EXTRA AS Extra
+    FROM information_schema.COLUMNS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+    ORDER BY ORDINAL_POSITION
+"""
+# 列信息、所在表的估算行数和列上的外键一次读取；一列有多个外键时该列对应多行且相邻
+SCHEMA_COLUMNS_WITH_KEYS_SQL = """
+    SELECT c.TABLE_NAME AS table_name, c.COLUMN_NAME AS name, c.COLUMN_TYPE AS type,
+           c.IS_NULLABLE AS nullable, c.COLUMN_KEY AS `key`, c.COLUMN_DEFAULT AS `default`, c.EXTRA AS extra,
+           t.TABLE_ROWS AS table_rows,
+           k.REFERENCED_TABLE_NAME AS referenced_table, k.REFERENCED_COLUMN_NAME AS referenced_column
+    FROM information_schema.COLUMNS AS c
+    JOIN information_schema.TABLES AS t
+      ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME
+    LEFT JOIN information_schema.KEY_COLUMN_USAGE AS k
+      ON k.TABLE_SCHEMA = c.TABLE_SCHEMA AND k.TABLE_NAME = c.TABLE_NAME
+     AND k.COLUMN_NAME = c.COLUMN_NAME AND k.REFERENCED_TABLE_NAME IS NOT NULL
+    WHERE c.TABLE_SCHEMA = %s
+    ORDER BY c.TABLE_NAME, c.ORDINAL_POSITION, k.CONSTRAINT_NAME
+"""
+SCHEMA_FOREIGN_KEYS_SQL = """
+    SELECT TABLE_NAME AS table_name, COLUMN_NAME AS `column`,
+           REFERENCED_TABLE_NAME AS referenced_table, REFERENCED_COLUMN_NAME AS referenced_column
+    FROM information_schema.KEY_COLUMN_USAGE
+    WHERE TABLE_SCHEMA = %s AND REFERENCED_TABLE_NAME IS NOT NULL
+    ORDER BY TABLE_NAME, CONSTRAINT_NAME, ORDINAL_POSITION
+"""
+SCHEMA_INDEXES_SQL = """
+    SELECT TABLE_NAME AS table_name, INDEX_NAME AS index_name, NON_UNIQUE AS non_unique, COLUMN_NAME AS column_name
+    FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = %s
+    ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+"""
+# 行数取 information_schema 中的统计估算值：InnoDB 下并不精确，但足够用于排序和规模判断，
+# 避免 COUNT(*) 对大表做全索引扫描；视图的 TABLE_ROWS 为 NULL
+SCHEMA_TABLE_ROWS_SQL = """
+    SELECT TABLE_NAME AS table_name, TABLE_ROWS AS table_rows
+    FROM information_schema.TABLES
+    WHERE TABLE_SCHEMA = %s
+"""
+
+def fetch_table_row_estimates(cursor, current_db):
+    """一次查询获取库中所有表的估算行数，返回以表名为键的字典"""
+    cursor.execute(SCHEMA_TABLE_ROWS_SQL, (current_db,))
+    return {row['table_name']: row['table_rows'] or 0 for row in cursor}
+
+def fetch_foreign_keys(cursor, current_db):
+    """一次查询获取库中所有外键，按表名分组"""
+    foreign_keys = defaultdict(list)
+    cursor.execute(SCHEMA_FOREIGN_KEYS_SQL, (current_db,))
+    for row in cursor:
+        foreign_keys[row.pop('table_name')].append(row)
+    return foreign_keys
+
+def fetch_schema_metadata(cursor, current_db):
+    """
+    通过 information_schema 批量获取库中所有表的列、主键、外键、索引和估算行数
+
+    固定2次查询（列、行数和外键联合查询一次，索引一次），不随表数量增加；返回以表名为键的字典
+    """
+    metadata = defaultdict(lambda: {
+        "columns": [],
+        "primary_key": None,
+        "foreign_keys": [],
+        "indexes": [],
+        "row_count": 0
+    })
+    
+    # 列信息、估算行数和外键
+    last_column = None
+    cursor.execute(SCHEMA_COLUMNS_WITH_KEYS_SQL, (current_db,))
+    for row in cursor:
+        table_name = row.pop('table_name')
+        table = metadata[table_name]
+        table_rows = row.pop('table_rows')
+        referenced_table = row.pop('referenced_table')
+        referenced_column = row.pop('referenced_column')
+        
+        # 同一列的多个外键各占一行，列本身只记录一次
+        if last_column != (table_name, row['name']):
+            last_column = (table_name, row['name'])
+            row['nullable'] = row['nullable'] == 'YES'
+            table["columns"].append(row)
+            table["row_count"] = table_rows or 0
+        
+        if referenced_table is not None:
+            table["foreign_keys"].append({
+                "column": row['name'],
+                "referenced_table": referenced_table,
+                "referenced_column": referenced_column
+            })
+    
+    # 主键和索引（同一索引的多列按 SEQ_IN_INDEX 顺序相邻）
+    index_columns = defaultdict(list)
+    index_unique = {}
+    cursor.execute(SCHEMA_INDEXES_SQL, (current_db,))
+    for row in cursor:
+        key = (row['table_name'], row['index_name'])
+        if row['column_name'] is not None:
+            index_columns[key].append(row['column_name'])
+        index_unique[key] = not row['non_unique']
+    for (table_name, index_name), columns in index_columns.items():
+        if index_name == 'PRIMARY':
+            # 与此前解析建表语句的结果保持一致：只记录单列主键
+            if len(columns) == 1:
+                metadata[table_name]["primary_key"] = columns[0]
+            continue
+        metadata[table_name]["indexes"].append({
+            "name": index_name,
+            "columns": columns,
+            "unique": index_unique[(table_name, index_name)]
+        })
+    
+    return metadata
+
+def collect_table_info(cursor, table_name):
+    """采集单个表的示例数据（结构信息和行数由 information_schema 批量获取）"""
+    table_info = {
+        "sample_data": []
+    }
+    
+    # 获取示例数据
+    try:
+        cursor.execute(f"SELECT * FROM {quote_identifier(table_name)} LIMIT 3")
+        samples = cursor.fetchall()
+        if samples:
+            table_info["sample_data"] = samples
+    except:
+        # 如果获取示例失败，不中断程序
+        pass
+    
+    return table_info
+
+def collect_sample_batch(cursor, table_names):
+    """
+    用一次多语句查询采集一批表的示例数据，按表的顺序返回
+
+    每个表一个结果集，整批只需一次往返；批量查询出错时退回逐表采集，单个表失败不影响其他表
+    """
+    sql = "; ".join(f"SELECT * FROM {quote_identifier(table_name)} LIMIT 3" for table_name in table_names)
+    try:
+        return [{"sample_data": result.fetchall()} for result in cursor.execute(sql, multi=True)]
+    except mysql.connector.Error:
+        return [collect_table_info(cursor, table_name) for table_name in table_names]
+
+def get_enhanced_database_structure(connection, include_samples=True, schema_fingerprint=None):
     """
     获取增强的数据库结构分析，包括表关系、索引、约束和数据统计信息
+    
+    Args:
+        connection: 数据库连接
+        include_samples: 是否逐表采集示例数据；为 False 时不查询表数据，sample_data 为空列表
+        schema_fingerprint: 可选，调用方已计算的表结构指纹（get_schema_fingerprint）；
+            提供时加入缓存键，指纹变化后不会读到旧的结构
     """
     try:
-        cursor = connection.cursor(dictionary=True)
-        
-        # 获取当前数据库名称
-        cursor.execute("SELECT DATABASE()")
-        current_db_result = cursor.fetchone()
-        if not current_db_result or not current_db_result['DATABASE()']:
-            return "未选择数据库，请先选择数据库"
-            
-        current_db = current_db_result['DATABASE()']
-        
-        # 收集数据库结构信息
-        db_info = {
-            "database_name": current_db,
-            "tables": [],
-            "relationships": [],
-            "database_stats": {}
-        }
-        
-        # 获取所有表
-        cursor.execute("SHOW TABLES")
-        tables = [table[f'Tables_in_{current_db}'] for table in cursor.fetchall()]
-        
-        # 收集表详细信息
-        for table_name in tables:
-            table_info = {
-                "name": table_name,
-                "columns": [],
-                "primary_key": None,
-                "foreign_keys": [],
-                "indexes": [],
-                "row_count": 0,
-                "sample_data": []
+        with closing(connection.cursor(dictionary=True, buffered=False)) as cursor:
+        
+            # 获取当前数据库名称和所有表
+            current_db, tables = get_db_and_tables(connection, cursor, schema_fingerprint)
+            if not current_db:
+                return "未选择数据库，请先选择数据库"
+        
+            # 表结构未变化时直接返回缓存
+            cache_kind = 'structure' if include_samples else 'structure_no_samples'
+            cache_key = get_schema_cache_key(connection, cursor, cache_kind, current_db, schema_fingerprint)
+            db_info = get_cached_schema(cache_key)
+            if db_info is not None:
+                return db_info
+        
+            # 收集数据库结构信息
+            db_info = {
+                "database_name": current_db,
+                "tables": [],
+                "relationships": [],
+                "database_stats": {}
             }
-            
-            # 获取表结构
-            cursor.execute(f"SHOW CREATE TABLE {table_name}")
-            create_table = cursor.fetchone()['Create Table']
-            
-            # 解析创建表语句获取约束和索引
-            # 提取主键
-            pk_match = re.search(r'PRIMARY KEY \(`([^`]+)`\)', create_table)
-            if pk_match:
-                table_info["primary_key"] = pk_match.group(1)
-                
-            # 提取外键
-            fk_matches = re.finditer(r'FOREIGN KEY \(`([^`]+)`\) REFERENCES `([^`]+)`\s*\(`([^`]+)`\)', create_table)
-            for match in fk_matches:
-                table_info["foreign_keys"].append({
-                    "column": match.group(1),
-                    "referenced_table": match.group(2),
-                    "referenced_column": match.group(3)
-                })
-                
-                # 添加到关系列表
-                db_info["relationships"].append({
-                    "from_table": table_name,
-                    "from_column": match.group(1),
-                    "to_table": match.group(2),
-                    "to_column": match.group(3)
-                })
-                
-            # 提取索引
-            index_matches = re.finditer(r'(UNIQUE )?KEY `([^`]+)`\s*\(`([^`]+)`\)', create_table)
-            for match in index_matches:
-                table_info["indexes"].append({
-                    "name": match.group(2),
-                    "columns": match.group(3).split('`,`'),
-                    "unique": bool(match.group(1))
-                })
-            
-            # 获取列信息
-            cursor.execute(f"DESCRIBE {table_name}")
-            columns = cursor.fetchall()
-            
-            for col in columns:
-                column_info = {
-                    "name": col['Field'],
-                    "type": col['Type'],
-                    "nullable": col['Null'] == 'YES',
-                    "key": col['Key'],
-                    "default": col['Default'],
-                    "extra": col['Extra']
-                }
-                table_info["columns"].append(column_info)
-            
-            # 获取行数
-            try:
-                cursor.execute(f"SELECT COUNT(*) as count FROM {table_name}")
-                count_result = cursor.fetchone()
-                if count_result:
-                    table_info["row_count"] = count_result['count']
-            except:
-                # 如果计数失败，不中断程序
-                pass
-            
-            # 获取示例数据
-            try:
-                cursor.execute(f"SELECT * FROM {table_name} LIMIT 3")
-                samples = cursor.fetchall()
-                if samples:
-                    table_info["sample_data"] = samples
-            except:
-                # 如果获取示例失败，不中断程序
-                pass
-            
-            db_info["tables"].append(table_info)
         
-        # 添加统计信息
-        db_info["database_stats"] = {
-            "table_count": len(tables),
-            "total_relationships": len(db_info["relationships"]),
-            "largest_tables": []
-        }
+            # 批量获取所有表的结构信息和估算行数，再按批采集示例数据
+            metadata = fetch_schema_metadata(cursor, current_db)
+            if include_samples:
+                batches = [tables[i:i + SAMPLE_BATCH_TABLES] for i in range(0, len(tables), SAMPLE_BATCH_TABLES)]
+                table_stats = list(chain.from_iterable(
+                    collect_sample_batch(cursor, batch) for batch in batches
+                ))
+            else:
+                table_stats = [{"sample_data": []} for _ in tables]
+            db_info["tables"] = [
+                {"name": table_name, **metadata[table_name], **stats}
+                for table_name, stats in zip(tables, table_stats)
+            ]
+        
+            # 汇总外键形成关系列表
+            for table_info in db_info["tables"]:
+                for fk in table_info["foreign_keys"]:
+                    db_info["relationships"].append({
+                        "from_table": table_info["name"],
+                        "from_column": fk["column"],
+                        "to_table": fk["referenced_table"],
+                        "to_column": fk["referenced_column"]
+                    })
         
-        # 获取最大的表（按行数）
-        sorted_tables = sorted(db_info["tables"], key=lambda x: x["row_count"], reverse=True)
-        db_info["database_stats"]["largest_tables"] = [
-            {"name": t["name"], "row_count": t["row_count"]} 
-            for t in sorted_tables[:3] if t["row_count"] > 0
-        ]
+            # 添加统计信息
+            db_info["database_stats"] = {
+                "table_count": len(tables),
+                "total_relationships": len(db_info["relationships"]),
+                "largest_tables": []
+            }
+        
+            # 获取最大的表（按行数）
+            sorted_tables = sorted(db_info["tables"], key=lambda x: x["row_count"], reverse=True)
+            db_info["database_stats"]["largest_tables"] = [
+                {"name": t["name"], "row_count": t["row_count"]} 
+                for t in sorted_tables[:3] if t["row_count"] > 0
+            ]
         
-        # 分析数据库和识别可能的架构模式
-        db_info["schema_analysis"] = analyze_database_schema(db_info)
+            # 分析数据库和识别可能的架构模式
+            db_info["schema_analysis"] = analyze_database_schema(db_info)
         
-        # 生成格式化的输出
-        output = json.dumps(db_info, indent=2, default=str)
-        return db_info
+            store_cached_schema(cache_key, db_info)
+            return db_info
         
     except Exception as e:
         print(f"获取增强数据库结构时出错：{e}")
         return get_database_structure_with_samples(connection)  # 回退到基本结构
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
 
 def analyze_database_schema(db_info):
     """分析数据库架构识别常见模式"""
@@ -277,9 +546,7 @@ def analyze_database_schema(db_info):
     # 检查是否为星型模式（一个事实表，多个维度表）
     if len(tables) > 2:
         # 计算每个表的参照次数
-        references_count = defaultdict(int)
-        for rel in relationships:
-            references_count[rel["to_table"]] += 1
+        references_count = Counter(rel["to_table"] for rel in relationships)
         
         # 寻找被多个表引用的表（可能的中心表）
         center_tables = [table for table, count in references_count.items() if count > 1]
@@ -300,10 +567,7 @@ def analyze_database_schema(db_info):
             )
     
     # 检查是否有孤立表（没有关系的表）
-    table_in_relationships = set()
-    for rel in relationships:
-        table_in_relationships.add(rel["from_table"])
-        table_in_relationships.add(rel["to_table"])
+    table_in_relationships = set(chain.from_iterable((rel["from_table"], rel["to_table"]) for rel in relationships))
     
     isolated_tables = [table["name"] for table in tables if table["name"] not in table_in_relationships]
     if isolated_tables:
@@ -311,79 +575,124 @@ def analyze_database_schema(db_info):
     
     return analysis
 
-def format_db_structure_for_prompt(db_info):
-    """格式化数据库结构信息，使其适合作为提示词的一部分"""
-    output = []
+def iter_table_prompt_lines(table):
+    """逐行生成单个表在提示词中的描述"""
+    yield f"表: {table['name']} ({table['row_count']} 行)"
+    
+    # 列信息（外键按列名预先分组，避免每列遍历全部外键）
+    foreign_keys = defaultdict(list)
+    for fk in table["foreign_keys"]:
+        foreign_keys[fk["column"]].append(f" [外键 -> {fk['referenced_table']}.{fk['referenced_column']}]")
+    
+    yield "  列:"
+    for col in table["columns"]:
+        yield "".join((
+            f"  - {col['name']} ({col['type']})",
+            " [主键]" if col['name'] == table["primary_key"] else "",
+            "".join(foreign_keys.get(col["name"], ())),
+            " [可空]" if col["nullable"] else "",
+            f" [{col['extra']}]" if col["extra"] else ""
+        ))
+    
+    # 索引信息
+    if table["indexes"]:
+        yield "  索引:"
+        for idx in table["indexes"]:
+            idx_type = "唯一索引" if idx["unique"] else "索引"
+            yield f"  - {idx_type} {idx['name']} 在列 {', '.join(idx['columns'])}"
+    
+    # 示例数据
+    if table["sample_data"]:
+        yield "  示例数据:"
+        for i, sample in enumerate(table["sample_data"], 1):
+            yield f"  - 行 {i}: " + ", ".join(f"{k}={v}" for k, v in sample.items())
     
+    yield ""  # 空行分隔表
+
+def iter_db_overview_prompt_lines(db_info):
+    """逐行生成数据库概要描述（库名、规模和架构分析）"""
     # 数据库基本信息
-    output.append(f"数据库名称: {db_info['database_name']}")
-    output.append(f"包含 {db_info['database_stats']['table_count']} 个表和 {db_info['database_stats']['total_relationships']} 个表间关系\n")
+    yield f"数据库名称: {db_info['database_name']}"
+    yield f"包含 {db_info['database_stats']['table_count']} 个表和 {db_info['database_stats']['total_relationships']} 个表间关系\n"
     
     # 架构分析
     if "schema_analysis" in db_info:
-        output.append("架构分析:")
-        output.append(f"- 架构类型: {db_info['schema_analysis']['schema_type']}")
-        
-        if db_info['schema_analysis']['potential_issues']:
-            output.append("- 潜在问题:")
-            for issue in db_info['schema_analysis']['potential_issues']:
-                output.append(f"  * {issue}")
+        schema_analysis = db_info['schema_analysis']
+        yield "架构分析:"
+        yield f"- 架构类型: {schema_analysis['schema_type']}"
+        
+        if schema_analysis['potential_issues']:
+            yield "- 潜在问题:"
+            for issue in schema_analysis['potential_issues']:
+                yield f"  * {issue}"
                 
-        if db_info['schema_analysis']['optimization_suggestions']:
-            output.append("- 优化建议:")
-            for suggestion in db_info['schema_analysis']['optimization_suggestions']:
-                output.append(f"  * {suggestion}")
-        output.append("")
+        if schema_analysis['optimization_suggestions']:
+            yield "- 优化建议:"
+            for suggestion in schema_analysis['optimization_suggestions']:
+                yield f"  * {suggestion}"
+        yield ""
+
+def iter_relationship_prompt_lines(relationships):
+    """逐行生成表关系描述，没有关系时不输出"""
+    if relationships:
+        yield "表关系:"
+        for rel in relationships:
+            yield f"- {rel['from_table']}.{rel['from_column']} -> {rel['to_table']}.{rel['to_column']}"
+
+def iter_db_structure_prompt_lines(db_info):
+    """逐行生成数据库结构描述，由 format_db_structure_for_prompt 一次性拼接"""
+    yield from iter_db_overview_prompt_lines(db_info)
     
     # 表结构信息
     for table in db_info["tables"]:
-        output.append(f"表: {table['name']} ({table['row_count']} 行)")
-        
-        # 列信息
-        output.append("  列:")
-        for col in table["columns"]:
-            col_desc = f"  - {col['name']} ({col['type']})"
-            
-            if col['name'] == table["primary_key"]:
-                col_desc += " [主键]"
-                
-            # 检查此列是否为外键
-            is_foreign_key = False
-            for fk in table["foreign_keys"]:
-                if fk["column"] == col["name"]:
-                    col_desc += f" [外键 -> {fk['referenced_table']}.{fk['referenced_column']}]"
-                    is_foreign_key = True
-            
-            if col["nullable"]:
-                col_desc += " [可空]"
-                
-            if col["extra"]:
-                col_desc += f" [{col['extra']}]"
-                
-            output.append(col_desc)
-        
-        # 索引信息
-        if table["indexes"]:
-            output.append("  索引:")
-            for idx in table["indexes"]:
-                idx_type = "唯一索引" if idx["unique"] else "索引"
-                output.append(f"  - {idx_type} {idx['name']} 在列 {', '.join(idx['columns'])}")
-        
-        # 示例数据
-        if table["sample_data"]:
-            output.append("  示例数据:")
-            for i, sample in enumerate(table["sample_data"], 1):
-                output.append(f"  - 行 {i}: " + ", ".join([f"{k}={v}" for k, v in sample.items()]))
-        
-        output.append("")  # 空行分隔表
+        yield from iter_table_prompt_lines(table)
     
     # 表关系
-    if db_info["relationships"]:
-        output.append("表关系:")
-        for rel in db_info["relationships"]:
-            output.append(f"- {rel['from_table']}.{rel['from_column']} -> {rel['to_table']}.{rel['to_column']}")
-    
-    return "\n".join(output)
+    yield from iter_relationship_prompt_lines(db_info["relationships"])
+
+def format_db_structure_for_prompt(db_info):
+    """格式化数据库结构信息，使其适合作为提示词的一部分"""
+    return "\n".join(iter_db_structure_prompt_lines(db_info))
+
+def get_db_structure_prompt_sections(db_info):
+    """
+    将增强的数据库结构拆分为可单独取舍的提示词片段，供按问题挑选相关的表
+
+    返回 (概要文本, 各表片段列表, 表关系列表)，各表片段为 (表名, 列名列表, 表描述文本)
+    """
+    overview = "\n".join(iter_db_overview_prompt_lines(db_info))
+    tables = [
+        (table["name"], [col["name"] for col in table["columns"]], "\n".join(iter_table_prompt_lines(table)))
+        for table in db_info["tables"]
+    ]
+    return overview, tables, db_info["relationships"]
+
+# 执行计划中视为全表扫描的访问类型
+FULL_SCAN_ACCESS_TYPES = frozenset({'ALL'})
+# 执行计划节点上的代价标记及对应的提示
+EXPLAIN_FLAG_ISSUES = (
+    ('using_temporary_table', "查询使用临时表，可能影响性能"),
+    ('using_filesort', "查询使用文件排序，可能影响性能"),
+)
+# 执行计划表格中展示的表节点字段及对应的表头（与传统 EXPLAIN 的列对应）
+EXPLAIN_TABLE_FIELDS = (
+    ('table_name', 'table'),
+    ('access_type', 'type'),
+    ('possible_keys', 'possible_keys'),
+    ('key', 'key'),
+    ('rows_examined_per_scan', 'rows'),
+    ('filtered', 'filtered'),
+)
+
+def iter_explain_nodes(node):
+    """深度优先遍历 EXPLAIN FORMAT=JSON 的计划树，依次产出其中的每个对象"""
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from iter_explain_nodes(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from iter_explain_nodes(item)
 
 def analyze_query_execution(connection, sql_query):
     """
@@ -397,70 +706,65 @@ def analyze_query_execution(connection, sql_query):
         str: 格式化的执行计划和分析
     """
     try:
-        cursor = connection.cursor(dictionary=True)
+        with closing(connection.cursor()) as cursor:
+        
+            # 执行EXPLAIN查询，JSON格式的执行计划只有一行一列
+            cursor.execute(f"EXPLAIN FORMAT=JSON {sql_query}")
+            plan_json = cursor.fetchall()[0][0]
+        
+            output = ["查询执行计划分析:"]
+        
+            # 遍历计划树分析执行计划，表节点（含 table_name）的关键字段汇总为表格
+            potential_issues = []
+            plan_rows = []
+            for node in iter_explain_nodes(orjson.loads(plan_json)):
+                if 'table_name' in node:
+                    plan_rows.append([
+                        ",".join(value) if isinstance(value, list) else value
+                        for value in (node.get(field) for field, _ in EXPLAIN_TABLE_FIELDS)
+                    ])
+                
+                # 检查是否有全表扫描
+                if node.get('access_type') in FULL_SCAN_ACCESS_TYPES:
+                    potential_issues.append(f"表 {node.get('table_name')} 上有全表扫描，考虑添加索引")
+                
+                # 检查是否有临时表、文件排序等代价较高的操作
+                potential_issues.extend(issue for flag, issue in EXPLAIN_FLAG_ISSUES if node.get(flag))
         
-        # 执行EXPLAIN查询
-        cursor.execute(f"EXPLAIN {sql_query}")
-        explain_results = cursor.fetchall()
+            # 格式化执行计划
+            output.append(tabulate(plan_rows, headers=[header for _, header in EXPLAIN_TABLE_FIELDS], tablefmt="grid"))
         
-        output = ["查询执行计划分析:"]
+            # 添加分析结果
+            if potential_issues:
+                output.append("\n优化建议:")
+                for issue in potential_issues:
+                    output.append(f"- {issue}")
+            else:
+                output.append("\n查询执行计划看起来不错，没有明显的性能问题。")
         
-        # 分析执行计划
-        potential_issues = []
-        for step in explain_results:
-            # 检查是否有全表扫描
-            if step.get('type') in ['ALL']:
-                potential_issues.append(f"表 {step.get('table')} 上有全表扫描，考虑添加索引")
-                
-            # 检查是否有大量临时表创建
-            if step.get('Extra') and 'Using temporary' in step.get('Extra'):
-                potential_issues.append("查询使用临时表，可能影响性能")
-                
-            # 检查是否有文件排序
-            if step.get('Extra') and 'Using filesort' in step.get('Extra'):
-                potential_issues.append("查询使用文件排序，可能影响性能")
-        
-        # 格式化执行计划
-        output.append(tabulate(explain_results, headers="keys", tablefmt="grid"))
-        
-        # 添加分析结果
-        if potential_issues:
-            output.append("\n优化建议:")
-            for issue in potential_issues:
-                output.append(f"- {issue}")
-        else:
-            output.append("\n查询执行计划看起来不错，没有明显的性能问题。")
-        
-        return "\n".join(output)
+            return "\n".join(output)
     except Exception as e:
         return f"分析查询执行计划时出错：{e}"
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
 
 def display_table_structure(connection):
     try:
-        cursor = connection.cursor()
-        cursor.execute("SHOW TABLES;")
-        tables = cursor.fetchall()
-        if not tables:
-            print("\n没有找到任何表。")
-            return
-        print("\n数据库中的表及其结构：")
-        for table in tables:
-            print(f"\n表名：{table[0]}")
-            cursor.execute(f"DESCRIBE {table[0]};")
-            structure = cursor.fetchall()
-            print(tabulate(structure, headers=["字段名", "类型", "是否为空", "主键", "默认值", "额外"], tablefmt="grid"))
+        with closing(connection.cursor()) as cursor:
+            cursor.execute("SHOW TABLES;")
+            tables = cursor.fetchall()
+            if not tables:
+                print("\n没有找到任何表。")
+                return
+            print("\n数据库中的表及其结构：")
+            for table in tables:
+                print(f"\n表名：{table[0]}")
+                cursor.execute(TABLE_COLUMNS_SQL, (table[0],))
+                structure = cursor.fetchall()
+                print(tabulate(structure, headers=["字段名", "类型", "是否为空", "主键", "默认值", "额外"], tablefmt="grid"))
     except mysql.connector.Error as e:
         print(f"操作失败，错误：{e}")
-    finally:
-        if 'cursor' in locals() and cursor:
-            cursor.close()
 
 def interactive_shell(connection):
-    try:
-        cursor = connection.cursor()
+    with closing(connection.cursor()) as cursor:
         print("\n欢迎进入 MySQL Shell 模式，输入 SQL 语句并按回车执行，输入 'exit' 或 'quit' 退出。\n")
         while True:
             sql = input("mysql> ").strip()
@@ -468,134 +772,118 @@ def interactive_shell(connection):
                 print("退出 MySQL Shell 模式")
                 break
             try:
-                start_time = time.time()
+                start_time = time.perf_counter()
                 cursor.execute(sql)
-                execution_time = time.time() - start_time
-                
+                execution_time = time.perf_counter() - start_time
+            
                 if sql.lower().startswith(("select", "show", "describe", "explain")):
-                    rows = cursor.fetchall()
+                    # 分页读取并显示，内存中只保留一页结果
                     headers = [desc[0] for desc in cursor.description]
-                    print(tabulate(rows, headers=headers, tablefmt="grid"))
-                    print(f"查询完成，返回 {len(rows)} 行记录，耗时: {execution_time:.3f}秒")
+                    row_count = 0
+                    while True:
+                        rows = cursor.fetchmany(SHELL_PAGE_ROWS)
+                        if not rows:
+                            break
+                        print(tabulate(rows, headers=headers if row_count == 0 else (), tablefmt="grid"))
+                        row_count += len(rows)
+                        if len(rows) == SHELL_PAGE_ROWS and input("-- 按回车显示更多，输入 q 停止 -- ").strip().lower() == 'q':
+                            # 丢弃剩余结果（逐行读取，不整体载入内存），保证连接可以继续使用
+                            for _ in cursor:
+                                pass
+                            break
+                    print(f"查询完成，显示 {row_count} 行记录，耗时: {execution_time:.3f}秒")
                 else:
                     rows_affected = cursor.rowcount
-                    while cursor.nextset():
-                        pass
+                    # 只有多语句（末尾分号之外仍含分号）才可能有后续结果集需要丢弃
+                    if ';' in sql.rstrip(';'):
+                        while cursor.nextset():
+                            pass
                     connection.commit()
                     print(f"执行成功！影响了 {rows_affected} 行，耗时: {execution_time:.3f}秒")
             except mysql.connector.Error as e:
                 print(f"SQL 错误：{e}")
-    finally:
-        if 'cursor' in locals() and cursor:
-            cursor.close()
+
+# 列键类型到图谱节点类型的映射，未列出的键类型视为普通列
+KEY_TO_NODE_TYPE = {'PRI': 'primary_key', 'MUL': 'index', 'UNI': 'index'}
 
 def analyze_table_relationships(connection):
     """
     分析数据库中表之间的关系，生成关系图谱数据
     
+    参数:
+        connection: 数据库连接
+    
     返回:
         dict: 包含节点和边的图谱数据
     """
     try:
-        cursor = connection.cursor(dictionary=True)
-        
-        # 获取当前数据库名称
-        cursor.execute("SELECT DATABASE()")
-        current_db_result = cursor.fetchone()
-        if not current_db_result or not current_db_result['DATABASE()']:
-            return {"error": "未选择数据库"}
-            
-        current_db = current_db_result['DATABASE()']
+        with closing(connection.cursor(dictionary=True)) as cursor:
+        
+            # 获取当前数据库名称和所有表
+            current_db, tables = get_db_and_tables(connection, cursor)
+            if not current_db:
+                return {"error": "未选择数据库"}
+        
+            # 表结构未变化时直接返回缓存
+            cache_key = get_schema_cache_key(connection, cursor, 'relationships', current_db)
+            graph_data = get_cached_schema(cache_key)
+            if graph_data is not None:
+                return graph_data
+        
+            # 图谱数据
+            graph_data = {
+                "nodes": [],
+                "edges": []
+            }
         
-        # 获取所有表
-        cursor.execute("SHOW TABLES")
-        tables = [table[f'Tables_in_{current_db}'] for table in cursor.fetchall()]
+            # 添加列节点和边（较少的表时可启用，表太多会导致图谱太复杂）
+            include_columns = len(tables) <= 10  # 限制只在表较少时显示列
         
-        # 图谱数据
-        graph_data = {
-            "nodes": [],
-            "edges": []
-        }
+            # 一次查询获取所有外键和估算行数
+            foreign_keys = fetch_foreign_keys(cursor, current_db)
+            row_counts = fetch_table_row_estimates(cursor, current_db)
         
-        # 添加表节点
-        for table_name in tables:
-            # 获取表的行数信息
-            try:
-                cursor.execute(f"SELECT COUNT(*) as count FROM {table_name}")
-                row_count = cursor.fetchone()['count']
-            except:
-                row_count = 0
-                
             # 添加表节点
-            graph_data["nodes"].append({
-                "id": table_name,
-                "label": table_name,
-                "size": min(30 + (row_count // 100), 100),  # 基于行数的节点大小
-                "type": "table"
-            })
-            
-            # 获取表的创建语句来提取外键关系
-            cursor.execute(f"SHOW CREATE TABLE {table_name}")
-            create_table = cursor.fetchone()['Create Table']
-            
-            # 提取外键约束
-            fk_constraints = []
-            for line in create_table.split('\n'):
-                line = line.strip()
-                if 'FOREIGN KEY' in line:
-                    fk_constraints.append(line)
-            
-            # 解析外键并添加边
-            for constraint in fk_constraints:
-                # 提取外键列名
-                fk_col_match = re.search(r'FOREIGN KEY \(`([^`]+)`\)', constraint)
-                if not fk_col_match:
-                    continue
-                fk_column = fk_col_match.group(1)
-                
-                # 提取引用表和列
-                ref_match = re.search(r'REFERENCES `([^`]+)`\s*\(`([^`]+)`\)', constraint)
-                if not ref_match:
-                    continue
-                    
-                ref_table = ref_match.group(1)
-                ref_column = ref_match.group(2)
+            for table_name in tables:
+                row_count = row_counts.get(table_name, 0)
                 
-                # 添加边
-                graph_data["edges"].append({
-                    "source": table_name,
-                    "target": ref_table,
-                    "label": f"{fk_column} -> {ref_column}",
-                    "type": "foreign_key"
+                # 添加表节点
+                graph_data["nodes"].append({
+                    "id": table_name,
+                    "label": table_name,
+                    "size": min(30 + (row_count // 100), 100),  # 基于行数的节点大小
+                    "type": "table"
                 })
+            
+                # 添加外键边
+                for fk in foreign_keys.get(table_name, ()):
+                    graph_data["edges"].append({
+                        "source": table_name,
+                        "target": fk["referenced_table"],
+                        "label": f"{fk['column']} -> {fk['referenced_column']}",
+                        "type": "foreign_key"
+                    })
         
-        # 添加列节点和边（较少的表时可启用，表太多会导致图谱太复杂）
-        if len(tables) <= 10:  # 限制只在表较少时显示列
-            for table_name in tables:
-                # 获取表的列信息
-                cursor.execute(f"SHOW COLUMNS FROM {table_name}")
-                columns = cursor.fetchall()
+            if include_columns:
+                # 一次查询获取库中所有列，按表名、列序排列
+                cursor.execute(SCHEMA_COLUMNS_SQL, (current_db,))
+                for column in cursor:
+                    table_name = column['table_name']
+                    column_name = column['name']
                 
-                for column in columns:
-                    column_name = column['Field']
-                    column_type = column['Type']
-                    is_primary = column['Key'] == 'PRI'
-                    is_index = column['Key'] in ('MUL', 'UNI')
-                    
                     # 创建列节点ID
                     column_id = f"{table_name}.{column_name}"
-                    
+                
                     # 添加列节点
-                    node_type = "primary_key" if is_primary else "index" if is_index else "column"
                     graph_data["nodes"].append({
                         "id": column_id,
                         "label": column_name,
                         "size": 15,  # 列节点较小
-                        "type": node_type,
+                        "type": KEY_TO_NODE_TYPE.get(column['key'], "column"),
                         "parent": table_name,  # 父表信息
-                        "data_type": column_type
+                        "data_type": column['type']
                     })
-                    
+                
                     # 添加表到列的边
                     graph_data["edges"].append({
                         "source": table_name,
@@ -603,11 +891,9 @@ def analyze_table_relationships(connection):
                         "type": "has_column"
                     })
         
-        return graph_data
+            store_cached_schema(cache_key, graph_data)
+            return graph_data
                 
     except Exception as e:
         print(f"分析表关系时出错：{e}")
-        return {"error": str(e)}
-    finally:
-        if 'cursor' in locals():
-            cursor.close()
+        return {"error": str(e)}
\ No newline at end of file
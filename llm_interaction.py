@@ -12,9 +12,12 @@ LLM交互模块 (llm_interaction.py)
 
 主要组件：
     - generate_sql(): 负责SQL生成的核心函数
+    - get_prompt_structure(): 获取并缓存SQL生成所需的数据库结构文本
+    - select_prompt_structure(): 按字符预算挑选与问题相关的表，限制结构文本长度
     - generate_answer(): 负责生成查询结果的自然语言解释
     - stream_generate_answer(): 提供流式结果解释
     - ai_interactive_shell(): 提供交互式的AI查询环境
+    - ConversationHistory: AI Shell 的对话历史，维护格式化好的历史文本
 
 工作流程：
     1. 接收用户输入 -> 理解意图 -> 生成SQL -> 执行查询 -> 解释结果
@@ -38,17 +41,86 @@ LLM交互模块 (llm_interaction.py)
 """
 from openai import OpenAI
 from config import API_KEY, BASE_URL, MODEL_NAME
-from utils.prompts import sql_prompt, extract_sql_prompt, clarify_prompt, answer_prompt, enhanced_clarify_prompt
+from utils.prompts import sql_prompt, extract_sql_prompt, clarify_prompt, answer_prompt, enhanced_clarify_prompt, sql_system_prompt, answer_system_prompt
+from utils.sql_cache import get_cached_sql, store_cached_sql
 from tabulate import tabulate
 import mysql.connector
+import threading
 import time
 import re
+import sys
 import traceback
-from db.utils import get_database_structure_with_samples, get_enhanced_database_structure
+from collections import deque
+from itertools import islice
+from db.connection import is_connection_alive, mark_connection_alive
+from db.utils import get_database_structure_with_samples, get_enhanced_database_structure, get_db_structure_prompt_sections, iter_relationship_prompt_lines, get_schema_fingerprint, get_statement_keyword, READ_ONLY_STATEMENTS
 
 # 全局变量，但不立即初始化
 client = None
 
+# SQL生成提示词中数据库结构文本的缓存有效期（秒）和最大条目数
+STRUCTURE_CACHE_TTL = 300
+STRUCTURE_CACHE_MAX_ENTRIES = 64
+# 结构缓存，键为 (服务器地址, 端口, 用户, 连接配置的数据库名)，值为 (过期时间, 表结构指纹, 结构提示词片段)
+_structure_cache = {}
+_structure_cache_lock = threading.Lock()
+# SQL生成提示词中数据库结构文本的字符预算，超出时只展开与问题相关的表
+STRUCTURE_PROMPT_BUDGET = 6000
+# 从问题中提取英文单词/标识符，用于匹配列名
+QUESTION_WORD_RE = re.compile(r'[a-z0-9_]+')
+
+# clean_sql_query 使用的正则：markdown代码块起止标记
+SQL_FENCE_START_RE = re.compile(r'^```(?:sql)?\s*', re.IGNORECASE)
+SQL_FENCE_END_RE = re.compile(r'\s*```$')
+# 一次扫描同时识别字符串字面量（原样保留）以及由 -- 注释和空白组成的连续片段（替换为单个空格）
+SQL_CLEAN_RE = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")|(?:\s+|--[^\n]*)+""")
+
+# AI Shell 保留的历史对话轮数
+SHELL_HISTORY_TURNS = 10
+# AI Shell 中单次查询最多读取和显示的行数
+SHELL_MAX_ROWS = 500
+# 存在这些子句时不自动追加 LIMIT
+SQL_LIMIT_BLOCKER_RE = re.compile(
+    r'\blimit\b|\bfor\s+(?:update|share)\b|\block\s+in\s+share\s+mode\b|\bnowait\b|\bskip\s+locked\b|\binto\b',
+    re.IGNORECASE
+)
+
+# 终端流式输出回答时的刷新间隔（秒）和最多累积的块数
+STDOUT_FLUSH_INTERVAL = 0.05
+STDOUT_FLUSH_CHUNKS = 64
+
+# 回答提示词中最多包含的结果行数
+ANSWER_PROMPT_MAX_ROWS = 50
+
+# analyze_query_complexity 一次扫描识别的关键字，按命名分组统计
+SQL_COMPLEXITY_RE = re.compile(
+    r'(?P<join>\bjoin\b)'
+    r'|(?P<agg>\b(?:count|sum|avg|min|max)\s*\()'
+    r'|(?P<group>\bgroup\s+by\b)'
+    r'|(?P<order>\border\s+by\b)'
+    r'|(?P<limit>\blimit\b)'
+    r'|(?P<sub>\(\s*select)'
+    r'|(?P<andor>\b(?:and|or)\b)'
+    r'|(?P<where>\bwhere\b)',
+    re.IGNORECASE
+)
+
+# 流式生成SQL时需要跟踪的引号（字符串和标识符），引号内的分号不视为语句结束
+SQL_QUOTE_CHARS = frozenset("'\"`")
+
+# 危险操作：删库删表、清空表、无WHERE条件的DELETE/UPDATE、删除列等结构修改，合并为一次扫描
+DANGEROUS_SQL_RE = re.compile(
+    r'\bdrop\s+(?:database|table)\b'
+    r'|\btruncate\s+table\b'
+    r'|\bdelete\s+from\b(?!.*\bwhere\b)'  # DELETE无WHERE条件
+    r'|\balter\s+table\b.*\bdrop\b'
+    r'|\bupdate\b(?!.*\bwhere\b)',  # UPDATE无WHERE条件
+    re.IGNORECASE
+)
+# 以这些关键字开头的单条语句不可能是危险操作，无需正则扫描
+# （WITH 语句由 get_statement_keyword 按主语句动词判断，WITH ... DELETE 不在其中）
+SAFE_SQL_KEYWORDS = READ_ONLY_STATEMENTS
+
 def get_client():
     """
     惰性初始化OpenAI客户端并返回
@@ -67,13 +139,113 @@ def get_client():
             raise ValueError(f"OpenAI客户端初始化失败：{str(e)}")
     return client
 
-def generate_sql(user_question, conversation_history=None, connection=None):
+def format_history_turn(user, response):
+    """格式化一轮对话，作为提示词中历史对话的一段"""
+    return f"用户：{user}\nLLM：{response}"
+
+class ConversationHistory:
+    """
+    AI Shell 的对话历史，只保留最近 max_turns 轮
+
+    每轮对话在追加时格式化一次并更新 text，generate_sql 直接使用 text 作为历史对话提示，
+    相同的历史在多次提问间保持完全一致的文本
+    """
+    def __init__(self, max_turns=10):
+        self.turns = deque(maxlen=max_turns)
+        self.text = "无历史对话"
+    
+    def append(self, user, response):
+        self.turns.append(format_history_turn(user, response))
+        self.text = "\n".join(self.turns)
+
+def select_prompt_structure(sections, user_question, budget=STRUCTURE_PROMPT_BUDGET):
+    """
+    按字符预算拼接结构提示词：总长度不超过预算时展开全部表，
+    否则按与问题的相关度（问题中出现表名、列名）依次展开表，其余表只列出表名
+    """
+    overview, tables, relationships = sections
+    if len(overview) + sum(len(block) for _, _, block in tables) <= budget:
+        selected = {name for name, _, _ in tables}
+    else:
+        question = user_question.lower()
+        words = set(QUESTION_WORD_RE.findall(question))
+
+        def relevance(table):
+            name, columns, _ = table
+            score = 10 if name.lower() in question else 0
+            return score + sum(1 for column in columns if column.lower() in words)
+
+        # sorted 是稳定排序，相关度相同的表保持原有顺序
+        selected, used = set(), len(overview)
+        for name, _, block in sorted(tables, key=relevance, reverse=True):
+            if used + len(block) <= budget or not selected:
+                selected.add(name)
+                used += len(block)
+
+    lines = [overview]
+    lines.extend(block for name, _, block in tables if name in selected)
+    lines.extend(iter_relationship_prompt_lines([
+        rel for rel in relationships if rel['from_table'] in selected and rel['to_table'] in selected
+    ]))
+    omitted = [name for name, _, _ in tables if name not in selected]
+    if omitted:
+        lines.append(f"其他表（结构未展开）: {', '.join(omitted)}")
+    return "\n".join(lines)
+
+def get_prompt_structure(connection, schema_fingerprint, user_question="", database=None):
+    """
+    获取用于SQL生成提示词的数据库结构文本（优先使用增强版）
+
+    同一服务器、用户和数据库的结构片段缓存 STRUCTURE_CACHE_TTL 秒，表结构指纹变化时立即重新获取，
+    连续提问时不再重复分析数据库结构；获取失败的结果不缓存。
+    结构文本由 select_prompt_structure 按问题挑选相关的表，长度受 STRUCTURE_PROMPT_BUDGET 限制
+    """
+    # database 为调用方连接配置中的数据库名（connection.database 每次都会执行 SELECT DATABASE()）；
+    # 会话中切换过数据库时表结构指纹随之变化，不会读到其他库的结构
+    key = (connection.server_host, connection.server_port, connection.user, database)
+    with _structure_cache_lock:
+        entry = _structure_cache.get(key)
+    if entry is not None and entry[0] > time.monotonic() and entry[1] == schema_fingerprint:
+        return select_prompt_structure(entry[2], user_question)
+    
+    try:
+        print(f"[INFO] 尝试获取增强数据库结构...")
+        database_structure = get_enhanced_database_structure(connection, schema_fingerprint=schema_fingerprint)
+        print(f"[INFO] 成功获取增强数据库结构")
+    except Exception as e:
+        print(f"[WARNING] 获取增强数据库结构失败: {str(e)}. 尝试基础版...")
+        try:
+            database_structure = get_database_structure_with_samples(connection)
+            print(f"[INFO] 成功获取基础数据库结构")
+        except Exception as e2:
+            print(f"[ERROR] 基础数据库结构获取也失败: {str(e2)}")
+            raise ValueError(f"无法获取数据库结构: {str(e2)}")
+    
+    # 只有增强版的结构分析结果才拆分并缓存，回退结果和错误提示每次重新获取
+    if not isinstance(database_structure, dict):
+        return database_structure
+    sections = get_db_structure_prompt_sections(database_structure)
+    
+    with _structure_cache_lock:
+        if len(_structure_cache) >= STRUCTURE_CACHE_MAX_ENTRIES:
+            del _structure_cache[next(iter(_structure_cache))]
+        _structure_cache[key] = (time.monotonic() + STRUCTURE_CACHE_TTL, schema_fingerprint, sections)
+    return select_prompt_structure(sections, user_question)
+
+def invalidate_structure_cache(host, port, user):
+    """数据或表结构被修改后，丢弃该服务器和用户下的所有结构文本缓存"""
+    with _structure_cache_lock:
+        for key in [k for k in _structure_cache if k[:3] == (host, port, user)]:
+            del _structure_cache[key]
+
+def generate_sql(user_question, conversation_history=None, connection=None, database=None):
     """
     根据用户问题、数据库结构和历史对话生成SQL查询。
     Args:
         user_question: 用户当前问题。
         conversation_history: 对话历史。
         connection: 数据库连接对象。
+        database: 连接配置中的数据库名，用于区分数据库结构缓存。
 
     Returns:
         str: 生成的 SQL 查询。
@@ -84,7 +256,7 @@ def generate_sql(user_question, conversation_history=None, connection=None):
     """
     if conversation_history is None:
         conversation_history = []
-    if connection is None or not connection.is_connected():
+    if connection is None or not is_connection_alive(connection):
         raise ConnectionError("有效的数据库连接是必需的。")
     
     # 获取OpenAI客户端实例
@@ -96,54 +268,41 @@ def generate_sql(user_question, conversation_history=None, connection=None):
 
     try:
         print(f"\n[INFO] 开始生成SQL，用户问题: {user_question}")
-        # 获取数据库结构 (优先使用增强版)
-        database_structure = ""
-        try:
-            print(f"[INFO] 尝试获取增强数据库结构...")
-            database_structure = get_enhanced_database_structure(connection)
-            print(f"[INFO] 成功获取增强数据库结构")
-        except Exception as e:
-            print(f"[WARNING] 获取增强数据库结构失败: {str(e)}. 尝试基础版...")
-            try:
-                database_structure = get_database_structure_with_samples(connection)
-                print(f"[INFO] 成功获取基础数据库结构")
-            except Exception as e2:
-                print(f"[ERROR] 基础数据库结构获取也失败: {str(e2)}")
-                raise ValueError(f"无法获取数据库结构: {str(e2)}")
+        # 获取数据库结构 (优先使用增强版，结构未过期时使用缓存)
+        schema_hash = get_schema_fingerprint(connection)
+        database_structure = get_prompt_structure(connection, schema_hash, user_question, database)
             
         if not database_structure or database_structure == "数据库结构获取失败，请检查数据库连接":
             raise ValueError("无法获取有效的数据库结构信息。")
 
-        # 构造对话历史
-        history_prompt = "\n".join(
-            [f"用户：{entry['user']}\nLLM：{entry['response']}" for entry in conversation_history]
-        ) if conversation_history else "无历史对话"
+        # 构造对话历史（ConversationHistory 已维护好格式化文本，无需每次重新拼接）
+        if isinstance(conversation_history, ConversationHistory):
+            history_prompt = conversation_history.text
+        else:
+            history_prompt = "\n".join(
+                [format_history_turn(entry['user'], entry['response']) for entry in conversation_history]
+            ) if conversation_history else "无历史对话"
 
-        # --- 核心提示构建 --- 
-        # TODO: 实际项目中，强烈建议将这个复杂的提示移到 utils/prompts.py
-        # 并进行更细致的优化 (加入Few-shot示例等)
-        
-        # 临时直接在这里构建增强提示，强调输出格式
-        core_prompt = f"""
-        任务：根据用户问题、数据库结构和历史对话，生成一个单一、可直接执行的MySQL查询语句。
+        # 同一表结构和历史对话下重复的问题直接返回缓存的SQL，不再调用LLM
+        cached_sql = get_cached_sql(schema_hash, history_prompt, user_question)
+        if cached_sql is not None:
+            print(f"[INFO] 命中SQL缓存: {cached_sql}")
+            return cached_sql
 
-        数据库结构 (包括示例数据):
-        {database_structure}
-
-        历史对话:
-        {history_prompt}
+        # --- 核心提示构建 --- 
+        # 固定的任务说明和规则放在系统提示 (sql_system_prompt) 中作为稳定前缀；
+        # 用户消息按变化频率排列：数据库结构 -> 历史对话 -> 当前问题，尽量延长可复用的前缀
+        # TODO: 进一步优化提示词 (加入Few-shot示例等)
+        core_prompt = f"""数据库结构 (包括示例数据):
+{database_structure}
 
-        当前用户问题:
-        {user_question}
+历史对话:
+{history_prompt}
 
-        重要规则:
-        1. **请只输出最终的MySQL查询语句本身。**
-        2. **不要包含任何解释、说明、注释、代码块标记 (例如 ```sql ... ```) 或其他非SQL文本。**
-        3. 确保生成的SQL语法正确，并与上述数据库结构兼容。
-        4. 如果用户问题不清晰或无法安全地转换为SQL，请只输出：ERROR: Ambiguous Query
+当前用户问题:
+{user_question}
 
-        生成的MySQL查询语句:
-        """
+生成的MySQL查询语句:"""
         
         # 使用 prompts.py 中的 SQL 生成提示 (如果可用且优化过，否则使用上面的 core_prompt)
         # try:
@@ -162,14 +321,17 @@ def generate_sql(user_question, conversation_history=None, connection=None):
 
         print(f"[INFO] 开始调用LLM生成SQL...")
         try:
-            completion = openai_client.chat.completions.create(
+            response = openai_client.chat.completions.create(
                 model=MODEL_NAME,
-                messages=[{"role": "user", "content": prompt}],
+                messages=[
+                    {"role": "system", "content": sql_system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
                 temperature=0.5,  # 稍降温度以提高SQL生成的准确性
                 timeout=45,  # 适当增加超时
-                stop=["```"] # 尝试让模型在代码块结束时停止 (如果它不听话)
+                stream=True
             )
-            llm_output = completion.choices[0].message.content
+            llm_output = collect_sql_stream(response)
             print(f"[INFO] LLM返回原始输出: {llm_output[:200]}...")
         except Exception as e:
             print(f"[ERROR] LLM SQL生成调用失败: {str(e)}")
@@ -197,6 +359,7 @@ def generate_sql(user_question, conversation_history=None, connection=None):
             raise ValueError("生成的SQL查询包含危险操作，已被系统拒绝")
             
         print(f"[INFO] SQL生成成功: {sql_query}")
+        store_cached_sql(schema_hash, history_prompt, user_question, sql_query)
         return sql_query
 
     except (ValueError, ConnectionError, RuntimeError) as e:
@@ -211,56 +374,127 @@ def generate_sql(user_question, conversation_history=None, connection=None):
         # 抛出一般性运行时错误
         raise RuntimeError(f"SQL生成过程中发生意外错误: {e}")
 
+def scan_sql_terminator(text, state=None):
+    """
+    扫描一段新生成的SQL文本，返回 (是否遇到引号和注释之外的分号, 扫描结束时的状态)
+
+    状态为 (所处的引号或注释, 上一个字符)，传入上一段文本的扫描结果，跨多段流式输出延续引号和注释状态，
+    被拆到两段中的 --、/*、*/ 和转义符也能识别
+    """
+    context, prev = state or (None, None)
+    for ch in text:
+        if context in SQL_QUOTE_CHARS:
+            if prev == '\\':
+                ch = None  # 被转义的字符不影响后续判断
+            elif ch == context:
+                context = None
+        elif context == '/*':
+            if prev == '*' and ch == '/':
+                context, ch = None, None
+        elif context == '--':
+            if ch == '\n':
+                context = None
+        elif ch in SQL_QUOTE_CHARS:
+            context = ch
+        elif ch == '#' or (ch == '-' and prev == '-'):
+            context = '--'
+        elif ch == '*' and prev == '/':
+            context, ch = '/*', None  # 注释开头的 * 不能和后面的 / 组成结束标记
+        elif ch == ';':
+            return True, (context, ch)
+        prev = ch
+    return False, (context, prev)
+
+def collect_sql_stream(response):
+    """
+    从流式响应中收集生成的SQL，完整的单条语句或错误标记出现后即关闭连接，不再等待后续输出
+
+    - 引号和注释之外出现分号：语句已经结束
+    - 开头的代码块标记之后又出现代码块标记：代码块已经结束
+    - 输出以 ERROR: 开头且错误说明所在行已结束：模型拒绝生成SQL
+    """
+    parts = []
+    state = None
+    try:
+        for chunk in response:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            parts.append(delta)
+            if '`' in delta:
+                # 代码块标记中的反引号不是标识符引号：跳过开头的代码块标记后重新扫描全文，
+                # 遇到结束标记时丢弃标记及其后的输出
+                text = "".join(parts).lstrip()
+                opening = SQL_FENCE_START_RE.match(text)
+                body_start = opening.end() if opening else 0
+                fence_end = text.find('```', body_start)
+                if fence_end != -1:
+                    parts = [text[:fence_end]]
+                    break
+                terminated, state = scan_sql_terminator(text[body_start:])
+            else:
+                terminated, state = scan_sql_terminator(delta, state)
+            if terminated:
+                break
+            if "\n" in delta and "".join(parts).lstrip().startswith("ERROR:"):
+                break
+    finally:
+        response.response.close()
+    return "".join(parts)
+
 def clean_sql_query(sql_query):
     """清理SQL查询字符串，移除markdown、注释和多余空格"""
     if not isinstance(sql_query, str):
         return "" # Handle cases where input is not a string
 
     # 移除markdown代码块标记
-    sql_query = re.sub(r'^```sql\s*', '', sql_query, flags=re.IGNORECASE).strip()
-    sql_query = re.sub(r'\s*```$', '', sql_query).strip()
-
-    # 按行分割并移除注释行
-    lines = sql_query.splitlines()
-    clean_lines = []
-    for line in lines:
-        stripped_line = line.strip()
-        if not stripped_line.startswith("--") and stripped_line:
-            # 移除行内注释 (虽然不常见，但可能出现)
-            line_no_inline_comment = re.sub(r'\s*--.*$', '', line)
-            if line_no_inline_comment.strip():
-                clean_lines.append(line_no_inline_comment)
-
-    # 重新组合并清理多余空格
-    sql_query = " ".join(clean_lines)
-    sql_query = re.sub(r'\s+', ' ', sql_query).strip()
+    sql_query = SQL_FENCE_START_RE.sub('', sql_query).strip()
+    sql_query = SQL_FENCE_END_RE.sub('', sql_query).strip()
 
-    # 可选：移除末尾分号 (如果执行器不需要)
-    if sql_query.endswith(';'):
-       sql_query = sql_query[:-1].strip()
+    # 单次扫描移除注释行和行内注释并合并多余空格，字符串字面量中的内容保持不变
+    sql_query = SQL_CLEAN_RE.sub(lambda match: match.group(1) or ' ', sql_query).strip()
 
-    return sql_query
+    # 可选：移除末尾分号 (如果执行器不需要)
+    return sql_query.rstrip(';').strip()
 
 def is_dangerous_sql(sql_query):
-    """检查SQL是否包含危险操作"""
-    # 转换为小写进行检查
-    sql_lower = sql_query.lower()
-    
-    # 检查是否包含数据修改或结构修改操作
-    dangerous_patterns = [
-        r'\bdrop\s+database\b', 
-        r'\bdrop\s+table\b',
-        r'\btruncate\s+table\b',
-        r'\bdelete\s+from\b(?!.*\bwhere\b)',  # DELETE无WHERE条件
-        r'\balter\s+table\b.*\bdrop\b',
-        r'\bupdate\b(?!.*\bwhere\b)'  # UPDATE无WHERE条件
-    ]
-    
-    for pattern in dangerous_patterns:
-        if re.search(pattern, sql_lower):
-            return True
-    
-    return False
+    """
+    检查SQL是否包含危险操作（数据修改或结构修改），所有模式一次扫描、不区分大小写
+
+    以只读关键字开头且不含分号（单条语句）的查询直接判定为安全，跳过正则扫描
+    """
+    if ';' not in sql_query and get_statement_keyword(sql_query) in SAFE_SQL_KEYWORDS:
+        return False
+    return DANGEROUS_SQL_RE.search(sql_query) is not None
+
+def format_result_table(rows, headers, total_rows, more_rows=False):
+    """
+    将查询结果格式化为紧凑的表格文本，结果被截断时注明显示的行数和总行数
+
+    more_rows 为 True 表示只读取了 total_rows 行、实际结果更多，总行数注明为“超过 total_rows 行”
+    """
+    if not total_rows:
+        return "(查询结果为空)"
+    table = tabulate(rows, headers=headers, tablefmt="github")
+    if more_rows:
+        table += f"\n(仅显示前 {len(rows)} 行，共超过 {total_rows} 行)"
+    elif total_rows > len(rows):
+        table += f"\n(仅显示前 {len(rows)} 行，共 {total_rows} 行)"
+    return table
+
+def format_query_results(query_results):
+    """
+    将查询结果转换为回答提示词中的表格文本
+
+    已格式化的文本原样返回；字典行（列表或任意可迭代对象）最多保留 ANSWER_PROMPT_MAX_ROWS 行，
+    其余行只计数不保留，以表格代替 Python 列表/字典的 repr，减少提示词长度
+    """
+    if isinstance(query_results, str):
+        return query_results
+    rows_iter = iter(query_results)
+    rows = list(islice(rows_iter, ANSWER_PROMPT_MAX_ROWS))
+    total_rows = len(rows) + sum(1 for _ in rows_iter)
+    return format_result_table(rows, "keys", total_rows)
 
 def generate_answer(user_question, query_results):
     """
@@ -280,30 +514,44 @@ def generate_answer(user_question, query_results):
         print(f"[ERROR] 获取OpenAI客户端失败: {str(e)}")
         return f"回答生成失败。错误: 无法初始化AI客户端"
         
-    prompt = answer_prompt.format(user_question=user_question, query_results=query_results)
+    prompt = answer_prompt.format(user_question=user_question, query_results=format_query_results(query_results))
     print("\n[DEBUG] Sending prompt to LLM for answer generation:")
     print(prompt)  # 输出发送给 LLM 的完整 Prompt
     
     # 初始化生成结果
-    answer = ""
+    answer_parts = []
     
     # 调用 OpenAI 接口并开启流式输出
     try:
         response = openai_client.chat.completions.create(
             model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
+            messages=[
+                {"role": "system", "content": answer_system_prompt},
+                {"role": "user", "content": prompt}
+            ],
             temperature=0.7,
             stream=True
         )
         print("\nAI 正在生成回答...")  # 提示生成开始
         
-        # 逐步接收流式输出
+        # 逐步接收流式输出；写入标准输出但不逐块刷新，按时间间隔或块数批量刷新
+        out = sys.stdout
+        last_flush = time.monotonic()
+        pending_chunks = 0
         for chunk in response:
             if chunk.choices[0].delta.content:
                 delta = chunk.choices[0].delta.content
-                print(delta, end="")
-                answer += delta
-                
+                out.write(delta)
+                answer_parts.append(delta)
+                pending_chunks += 1
+                now = time.monotonic()
+                if pending_chunks >= STDOUT_FLUSH_CHUNKS or now - last_flush >= STDOUT_FLUSH_INTERVAL:
+                    out.flush()
+                    last_flush = now
+                    pending_chunks = 0
+        out.flush()
+        
+        answer = "".join(answer_parts)
         print("\n\n[DEBUG] Final Generated Answer:\n", answer)  # 输出完整回答
         return answer
     except Exception as e:
@@ -330,38 +578,70 @@ def stream_generate_answer(user_question, query_results):
         return
         
     print("\n[INFO] 开始流式生成回答")
-    prompt = answer_prompt.format(user_question=user_question, query_results=query_results)
+    prompt = answer_prompt.format(user_question=user_question, query_results=format_query_results(query_results))
     print(f"[INFO] 构建回答提示完成，长度: {len(prompt)}")
     
     try:
         print(f"[INFO] 开始调用LLM流式生成...")
         response = openai_client.chat.completions.create(
             model=MODEL_NAME,
-            messages=[{"role": "user", "content": prompt}],
+            messages=[
+                {"role": "system", "content": answer_system_prompt},
+                {"role": "user", "content": prompt}
+            ],
             temperature=0.7,
             stream=True
         )
         print(f"[INFO] 已开始流式接收回答...")
         
-        total_content = ""
+        total_length = 0
         for chunk in response:
             if chunk.choices[0].delta.content:
                 delta = chunk.choices[0].delta.content
-                total_content += delta
+                total_length += len(delta)
                 yield delta
                 
-        print(f"[INFO] 流式回答生成完成，总长度: {len(total_content)}")
+        print(f"[INFO] 流式回答生成完成，总长度: {total_length}")
                 
     except Exception as e:
         error_msg = f"回答生成失败。错误: {str(e)}"
         print(f"[ERROR] LLM 流式输出过程中发生错误：{e}")
         yield error_msg
 
-def ai_interactive_shell(connection):
+def ensure_select_limit(sql_query, limit):
+    """
+    为没有 LIMIT 的单条 SELECT 语句追加 LIMIT，限制服务器返回的行数
+
+    已有 LIMIT，或包含 FOR UPDATE/FOR SHARE、LOCK IN SHARE MODE、INTO 等不能在末尾追加 LIMIT 的子句时原样返回
+    """
+    if sql_query.lstrip()[:6].lower() != "select" or ';' in sql_query or SQL_LIMIT_BLOCKER_RE.search(sql_query):
+        return sql_query
+    return f"{sql_query} LIMIT {limit}"
+
+def prime_structure_cache(connection, database=None):
+    """预先获取并缓存数据库结构文本，供下一次 generate_sql 直接使用；失败时忽略，由 generate_sql 重新获取"""
+    try:
+        get_prompt_structure(connection, get_schema_fingerprint(connection), database=database)
+    except Exception as e:
+        print(f"[WARNING] 预取数据库结构失败: {str(e)}")
+
+def start_structure_prefetch(connection, database=None):
+    """在后台线程中预取数据库结构，返回线程对象；再次使用该连接前必须先 join()"""
+    thread = threading.Thread(target=prime_structure_cache, args=(connection, database), daemon=True)
+    thread.start()
+    return thread
+
+def ai_interactive_shell(connection, database=None):
     """
     AI 辅助的 MySQL Shell 模式，支持通过自然语言生成 SQL 并执行。
+
+    database 为建立连接时指定的数据库名，用于区分数据库结构缓存
     """
-    conversation_history = []
+    conversation_history = ConversationHistory(SHELL_HISTORY_TURNS)
+    # 整个会话复用同一个非缓冲游标；每次查询的结果都会读完或丢弃，游标可直接用于下一次查询
+    cursor = connection.cursor(buffered=False)
+    # 等待用户输入期间在后台预取数据库结构；连接不能并发使用，主线程使用连接前先等待预取结束
+    prefetch = start_structure_prefetch(connection, database)
     try:
         print("\n欢迎使用AI辅助MySQL交互Shell。输入自然语言问题，AI会为您翻译成SQL并执行。")
         print("输入 'exit' 或 'quit' 可退出。\n")
@@ -375,12 +655,13 @@ def ai_interactive_shell(connection):
             if not user_question:
                 continue
 
+            prefetch.join()
             try:
                 # 显示思考中提示
                 print("AI正在思考中...", end="\r")
                 
                 # 调用 SQL 生成逻辑
-                sql_query = generate_sql(user_question, conversation_history, connection=connection)
+                sql_query = generate_sql(user_question, conversation_history, connection=connection, database=database)
                 if not sql_query:
                     print("无法生成有效的SQL查询")
                     continue
@@ -388,24 +669,32 @@ def ai_interactive_shell(connection):
                 print(f"\n生成的SQL查询：\n{sql_query}\n")
                 print("执行中...", end="\r")
 
-                # 执行 SQL 查询
+                # 执行 SQL 查询（非缓冲游标，结果由服务器分批发送，只读取需要显示的行）
                 start_time = time.time()
-                cursor = connection.cursor()
-                cursor.execute(sql_query)
+                cursor.execute(ensure_select_limit(sql_query, SHELL_MAX_ROWS + 1))
+                mark_connection_alive(connection)
                 
-                if sql_query.lower().startswith(("select", "show", "describe", "explain")):
-                    rows = cursor.fetchall()
+                if get_statement_keyword(sql_query) in READ_ONLY_STATEMENTS:
+                    # 多读一行用于判断结果是否被截断，其余结果直接丢弃以便连接继续使用
+                    rows = cursor.fetchmany(SHELL_MAX_ROWS + 1)
+                    truncated = len(rows) > SHELL_MAX_ROWS
+                    if truncated:
+                        rows = rows[:SHELL_MAX_ROWS]
+                        for _ in cursor:
+                            pass
                     headers = [desc[0] for desc in cursor.description]
                     
                     # 显示执行时间和结果数量
                     execution_time = time.time() - start_time
-                    print(f"查询完成 ({execution_time:.2f}秒) - 返回 {len(rows)} 条结果：\n")
+                    limit_note = f"（仅显示前 {SHELL_MAX_ROWS} 条）" if truncated else ""
+                    print(f"查询完成 ({execution_time:.2f}秒) - 返回 {len(rows)} 条结果{limit_note}：\n")
                     
                     # 显示结果表格
                     print(tabulate(rows, headers=headers, tablefmt="grid"))
 
-                    # 调用回答生成逻辑
-                    query_results = [dict(zip(headers, row)) for row in rows]
+                    # 调用回答生成逻辑（直接传入紧凑的表格文本，不再逐行构造字典）；
+                    # 结果被截断时只知道超过 SHELL_MAX_ROWS 行，不能当作准确的总行数
+                    query_results = format_result_table(rows[:ANSWER_PROMPT_MAX_ROWS], headers, len(rows), truncated)
                     print("\nAI正在解释结果...\n")
                     answer = generate_answer(user_question, query_results)
                     print(f"\n{answer}")
@@ -417,12 +706,11 @@ def ai_interactive_shell(connection):
                     execution_time = time.time() - start_time
                     print(f"执行成功! ({execution_time:.2f}秒) - 影响了 {rows_affected} 行")
 
-                # 保存对话到历史
-                conversation_history.append({"user": user_question, "response": sql_query})
+                # 保存对话到历史（超出 SHELL_HISTORY_TURNS 轮时自动丢弃最早的记录）
+                conversation_history.append(user_question, sql_query)
                 
-                # 限制历史长度为10条
-                if len(conversation_history) > 10:
-                    conversation_history = conversation_history[-10:]
+                # 用户输入下一个问题期间预取数据库结构
+                prefetch = start_structure_prefetch(connection, database)
                     
             except mysql.connector.Error as e:
                 print(f"SQL 错误：{e}")
@@ -430,8 +718,8 @@ def ai_interactive_shell(connection):
                 print(f"执行查询时发生错误：{e}")
                 
     finally:
-        if 'cursor' in locals() and cursor:
-            cursor.close()
+        prefetch.join()
+        cursor.close()
             
 def analyze_query_complexity(sql_query):
     """
@@ -443,8 +731,6 @@ def analyze_query_complexity(sql_query):
     Returns:
         dict: 包含复杂性分析的字典
     """
-    sql_lower = sql_query.lower()
-    
     analysis = {
         "complexity": "简单",
         "joins": 0,
@@ -456,32 +742,32 @@ def analyze_query_complexity(sql_query):
         "subqueries": 0
     }
     
-    # 计算JOIN次数
-    analysis["joins"] = len(re.findall(r'\bjoin\b', sql_lower))
-    
-    # 计算WHERE条件数(粗略估计)
-    if 'where' in sql_lower:
-        conditions = sql_lower.split('where')[1].split('group by')[0].split('order by')[0].split('limit')[0]
-        analysis["conditions"] = len(re.findall(r'\band\b|\bor\b', conditions)) + 1
-    
-    # 检查聚合函数
-    if re.search(r'\b(count|sum|avg|min|max)\s*\(', sql_lower):
-        analysis["aggregations"] = True
-    
-    # 检查GROUP BY
-    if 'group by' in sql_lower:
-        analysis["grouping"] = True
-    
-    # 检查ORDER BY
-    if 'order by' in sql_lower:
-        analysis["sorting"] = True
-    
-    # 检查LIMIT
-    if 'limit' in sql_lower:
-        analysis["limit"] = True
+    # 一次扫描统计所有关键字；WHERE条件数(粗略估计)只统计第一个WHERE之后、
+    # 遇到 GROUP BY / ORDER BY / LIMIT 或下一个WHERE之前的 AND/OR
+    counts = dict.fromkeys(("join", "agg", "group", "order", "limit", "sub"), 0)
+    in_where = None  # None: 尚未遇到WHERE，True: 正在统计条件，False: 条件段已结束
+    for match in SQL_COMPLEXITY_RE.finditer(sql_query):
+        kind = match.lastgroup
+        if kind == "andor":
+            if in_where:
+                analysis["conditions"] += 1
+        elif kind == "where":
+            if in_where is None:
+                in_where = True
+                analysis["conditions"] = 1
+            else:
+                in_where = False
+        else:
+            counts[kind] += 1
+            if in_where and kind in ("group", "order", "limit"):
+                in_where = False
     
-    # 检查子查询
-    analysis["subqueries"] = len(re.findall(r'\(\s*select', sql_lower))
+    analysis["joins"] = counts["join"]
+    analysis["aggregations"] = counts["agg"] > 0
+    analysis["grouping"] = counts["group"] > 0
+    analysis["sorting"] = counts["order"] > 0
+    analysis["limit"] = counts["limit"] > 0
+    analysis["subqueries"] = counts["sub"]
     
     # 综合评估复杂性
     complexity_score = (
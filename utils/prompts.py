@@ -16,6 +16,8 @@
     - clarify_prompt: 查询意图澄清模板
     - enhanced_clarify_prompt: 增强版查询意图澄清模板
     - answer_prompt: 结果解释生成模板
+    - sql_system_prompt: SQL生成的系统提示（固定的任务说明和输出规则）
+    - answer_system_prompt: 结果解释的系统提示（固定的角色说明和回答要求）
 
 工作流程：
     1. 使用clarify_prompt或enhanced_clarify_prompt明确用户意图
@@ -24,19 +26,18 @@
     4. 使用answer_prompt生成结果解释
 
 技术特点：
-    - 模板化提示词管理
+    - 模板为普通字符串，直接调用 str.format 填充，无需额外的模板库
     - 多级处理流程
     - 结构化的提示词设计
     - 清晰的输入输出定义
     - 深度数据库结构感知
+    - 固定内容放在系统提示中作为稳定前缀，便于模型服务端复用提示词缓存
 
 依赖项：
-    - langchain.prompts: 提示词模板管理
+    - 无（模板均为普通字符串，调用 str.format 填充变量）
 """
 
-from langchain.prompts import PromptTemplate
-
-sql_prompt = PromptTemplate(template='''
+sql_prompt = '''
 你是一个专业的 SQL 查询生成器。请根据以下数据库结构和用户需求生成最优的 SQL 查询语句：
 
 数据库结构：
@@ -58,9 +59,9 @@ sql_prompt = PromptTemplate(template='''
 11. 对于复杂条件，使用括号明确逻辑优先级
 
 请直接输出SQL语句，不要包含任何注释、标记或解释。
-''')
+'''
 
-extract_sql_prompt = PromptTemplate(template='''
+extract_sql_prompt = '''
 请从以下内容中提取并优化 SQL 查询语句：
 
 输入内容：{llm_output}
@@ -75,9 +76,9 @@ extract_sql_prompt = PromptTemplate(template='''
 7. 合理设置查询限制，避免返回过多数据
 
 请只返回优化后的SQL语句，不要包含任何解释、注释或markdown标记。
-''')
+'''
 
-clarify_prompt = PromptTemplate(template='''
+clarify_prompt = '''
 作为数据库查询专家，请分析并明确用户的查询需求：
 
 历史对话：
@@ -99,9 +100,9 @@ clarify_prompt = PromptTemplate(template='''
 7. 可能的边界情况处理
 
 请用专业的数据库术语描述需求，以便生成精确的 SQL。
-''')
+'''
 
-enhanced_clarify_prompt = PromptTemplate(template='''
+enhanced_clarify_prompt = '''
 作为高级数据库查询专家，请深入分析用户的查询需求，考虑数据库结构和历史上下文：
 
 历史对话：
@@ -153,13 +154,24 @@ enhanced_clarify_prompt = PromptTemplate(template='''
    - 查询是否与历史对话相关
 
 请用简洁专业的数据库术语提供深度分析，为后续SQL生成奠定基础。
-''')
+'''
+
+sql_system_prompt = '''任务：根据用户问题、数据库结构和历史对话，生成一个单一、可直接执行的MySQL查询语句。
 
-answer_prompt = PromptTemplate(template='''
-作为一个专业而友好的数据库分析助手，请根据用户问题和查询结果提供有见解的回答。
+重要规则:
+1. **请只输出最终的MySQL查询语句本身。**
+2. **不要包含任何解释、说明、注释、代码块标记 (例如 ```sql ... ```) 或其他非SQL文本。**
+3. 确保生成的SQL语法正确，并与给出的数据库结构兼容。
+4. 如果用户问题不清晰或无法安全地转换为SQL，请只输出：ERROR: Ambiguous Query
+'''
 
+answer_prompt = '''
 用户问题：{user_question}
-查询结果：{query_results}
+查询结果表格：
+{query_results}
+'''
+
+answer_system_prompt = '''作为一个专业而友好的数据库分析助手，请根据用户问题和查询结果提供有见解的回答。
 
 回答要求：
 1. 使用自然、友好且专业的语言直接回答用户问题
@@ -173,5 +185,5 @@ answer_prompt = PromptTemplate(template='''
 9. 使用清晰的段落结构和自然的过渡
 10. 确保回答专业且有信息价值，同时保持对话语气
 
-直接开始回答，无需任何引言或结语：
-''')
+直接开始回答，无需任何引言或结语。
+'''
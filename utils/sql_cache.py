@@ -0,0 +1,57 @@
+"""
+SQL生成缓存模块 (sql_cache.py)
+============================
+
+该模块缓存自然语言问题到SQL的生成结果，重复提问时无需再次调用LLM。主要功能包括：
+
+核心功能：
+    1. 问题归一化：忽略大小写、多余空白和句末标点，措辞相同的问题命中同一条缓存
+    2. 结果缓存：按表结构指纹、历史对话和归一化后的问题缓存生成的SQL
+    3. 容量控制：超出容量时按写入顺序淘汰最早的条目
+
+主要组件：
+    - get_cached_sql(): 读取缓存的SQL
+    - store_cached_sql(): 写入生成的SQL
+
+技术特点：
+    - 表结构指纹（db.utils.get_schema_fingerprint）参与缓存键，表结构变化后旧结果自然失效
+    - 历史对话参与缓存键，依赖上下文的追问不会误用其他对话的结果
+    - 线程安全，可被多个请求共享
+
+依赖项：
+    - re: 问题归一化
+"""
+
+import re
+import threading
+
+# 缓存的最大条目数，超出后淘汰最早写入的条目
+SQL_CACHE_MAX_ENTRIES = 1000
+# 问题归一化：句首句尾的空白和标点，以及句中的连续空白
+QUESTION_TRIM_CHARS = ' \t\r\n?？。.!！'
+QUESTION_WHITESPACE_RE = re.compile(r'\s+')
+
+# 键为 (结构指纹, 历史对话, 归一化后的问题)，值为生成的SQL；dict 保持写入顺序
+_sql_cache = {}
+_sql_cache_lock = threading.Lock()
+
+
+def normalize_question(question):
+    """忽略大小写、多余空白和句末标点，得到用于缓存键的问题文本"""
+    return QUESTION_WHITESPACE_RE.sub(' ', question.strip(QUESTION_TRIM_CHARS)).lower()
+
+
+def get_cached_sql(schema_hash, history_prompt, question):
+    """读取缓存的SQL，不存在时返回 None"""
+    key = (schema_hash, history_prompt, normalize_question(question))
+    with _sql_cache_lock:
+        return _sql_cache.get(key)
+
+
+def store_cached_sql(schema_hash, history_prompt, question, sql_query):
+    """写入生成的SQL，已满时丢弃最早写入的条目"""
+    key = (schema_hash, history_prompt, normalize_question(question))
+    with _sql_cache_lock:
+        if key not in _sql_cache and len(_sql_cache) >= SQL_CACHE_MAX_ENTRIES:
+            del _sql_cache[next(iter(_sql_cache))]
+        _sql_cache[key] = sql_query
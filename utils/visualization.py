@@ -0,0 +1,157 @@
+"""
+可视化推荐模块 (visualization.py)
+==============================
+
+该模块根据查询结果的列类型推荐合适的图表类型，并生成前端图表所需的数据。主要功能包括：
+
+核心功能：
+    1. 列类型识别：将结果列划分为数值列、时间列和分类列
+    2. 图表推荐：根据列的组合选择柱状图、散点图、折线图、饼图或表格
+    3. 图表数据生成：按列组织标签和数据序列
+
+主要组件：
+    - recommend_visualization(): 推荐可视化类型并生成图表数据
+
+技术特点：
+    - 结果集只转置一次，按列读取数据
+    - 按第一个非空值的精确类型判断列类型
+    - 函数带完整类型注解且不依赖Flask，可用 mypyc 单独编译为C扩展：
+      mypyc utils/visualization.py，编译产物与源码同名，导入方式不变
+
+依赖项：
+    - re: 日期格式检测
+"""
+
+import re
+from typing import Any, Dict, List, Tuple
+
+# 视为数值列的Python类型（按 type() 精确匹配，不走 isinstance 的继承检查）
+NUMERIC_TYPES = frozenset((int, float, bool))
+# 日期格式检测：YYYY-MM-DD、MM/DD/YYYY、YYYY/MM/DD
+DATE_PATTERN_RE = re.compile(r'\d{4}-\d{2}-\d{2}|\d{2}/\d{2}/\d{4}|\d{4}/\d{2}/\d{2}')
+# 超过该列数或行数的结果直接以表格展示，不做列类型分析
+TABLE_ONLY_MAX_COLUMNS = 6
+TABLE_ONLY_MAX_ROWS = 5000
+
+
+def recommend_visualization(results: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+    """
+    根据查询结果推荐合适的可视化类型
+    返回：推荐的可视化类型与处理后的图表数据
+    """
+    if not results:
+        return 'none', {}
+        
+    # 分析返回的列数
+    columns = list(results[0].keys())
+    num_columns = len(columns)
+    
+    # 列很多或行很多的结果不适合绘图，跳过整个分析过程
+    if num_columns > TABLE_ONLY_MAX_COLUMNS or len(results) > TABLE_ONLY_MAX_ROWS:
+        return 'table', {'data': results}
+    
+    # 一次遍历把行转置为列，后续按列取值不再逐行查字典；
+    # 列元组可直接作为图表数据序列化，无需再复制为列表
+    column_values = dict(zip(columns, zip(*map(dict.values, results))))
+    
+    # 检查是否每列都是数值型
+    numeric_columns: List[str] = []
+    categorical_columns: List[str] = []
+    temporal_columns: List[str] = []
+    
+    for col in columns:
+        # 取这一列的第一个非空值
+        first_value = next((val for val in column_values[col] if val is not None), None)
+        if first_value is None:
+            continue
+            
+        # 同一列的非空值类型一致，只需检查第一个值的类型
+        value_type = type(first_value)
+        
+        # 按出现频率排列判断顺序：数值列（聚合值、ID）最常见，先做廉价的类型判断；
+        # 只有字符串列才需要用正则检测是否为日期
+        if value_type in NUMERIC_TYPES:
+            numeric_columns.append(col)
+            # 已有两个数值列时结果必定是散点图，其余列无需再分析
+            if len(numeric_columns) == 2:
+                break
+        elif value_type is str and DATE_PATTERN_RE.search(first_value) is not None:
+            temporal_columns.append(col)
+        else:
+            categorical_columns.append(col)
+    
+    # 根据列特性推荐可视化类型
+    chart_data: Dict[str, Any] = {}
+    
+    # 情况1: 一个分类列和一个数值列 -> 柱状图
+    if len(categorical_columns) == 1 and len(numeric_columns) == 1:
+        cat_col = categorical_columns[0]
+        num_col = numeric_columns[0]
+        
+        labels = list(map(str, column_values[cat_col]))
+        values = column_values[num_col]
+        
+        chart_data = {
+            'labels': labels,
+            'datasets': [{
+                'label': num_col,
+                'data': values
+            }]
+        }
+        return 'bar', chart_data
+        
+    # 情况2: 两个数值列 -> 散点图
+    elif len(numeric_columns) >= 2:
+        x_col = numeric_columns[0]
+        y_col = numeric_columns[1]
+        
+        points = [{'x': x, 'y': y} for x, y in zip(column_values[x_col], column_values[y_col])]
+        
+        chart_data = {
+            'datasets': [{
+                'label': f'{x_col} vs {y_col}',
+                'data': points
+            }]
+        }
+        return 'scatter', chart_data
+        
+    # 情况3: 一个时间列和一个数值列 -> 折线图
+    elif len(temporal_columns) >= 1 and len(numeric_columns) >= 1:
+        time_col = temporal_columns[0]
+        num_col = numeric_columns[0]
+        
+        labels = list(map(str, column_values[time_col]))
+        values = column_values[num_col]
+        
+        chart_data = {
+            'labels': labels,
+            'datasets': [{
+                'label': num_col,
+                'data': values
+            }]
+        }
+        return 'line', chart_data
+        
+    # 情况4: 只有一个数值列 -> 饼图
+    elif len(numeric_columns) == 1 and len(results) <= 10:
+        num_col = numeric_columns[0]
+        
+        if len(categorical_columns) > 0:
+            cat_col = categorical_columns[0]
+            labels = list(map(str, column_values[cat_col]))
+        else:
+            labels = [f'Item {i+1}' for i in range(len(results))]
+            
+        values = column_values[num_col]
+        
+        chart_data = {
+            'labels': labels,
+            'datasets': [{
+                'data': values
+            }]
+        }
+        return 'pie', chart_data
+        
+    # 情况5: 表格数据 -> 表格视图
+    else:
+        return 'table', {'data': results}